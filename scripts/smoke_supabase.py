@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Manual smoke test against the configured Supabase project.
+
+Reads customers and conversation history and, if any customer exists,
+inserts a test message into their history. Run it by hand only; it writes
+to the real database.
+
+    python scripts/smoke_supabase.py
+"""
+import sys
+import os
+import asyncio
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from main import load_environment
+
+load_environment()
+
+import supabase_connector
+from supabase_connector import (
+    get_all_conversation_history,
+    get_customers,
+    add_conversation_history
+)
+
+async def main_example():
+    """Example usage of the async functions."""
+    # Retrieve all conversation history records
+    data = get_all_conversation_history()
+    print(f"Found {len(data)} conversation records")
+    
+    # Example: Get all customers
+    all_customers = await get_customers()
+    print(f"Found {len(all_customers)} customers")
+    
+    # Example: Get customer by phone
+    customer_by_phone = await get_customers(phone="34662578011")
+    print(f"Found {len(customer_by_phone)} customers with that phone")
+    
+    # Example: Get customer by ID
+    if all_customers:
+        customer_by_id = await get_customers(customer_id=all_customers[0]['id'])
+        print(f"Found {len(customer_by_id)} customers with that ID")
+    
+    example_message = {
+        "type": "human",
+        "content": "Test message",
+        "additional_kwargs": {},
+        "response_metadata": {}
+    }
+    
+    # Add a new conversation history record if we have customers
+    if all_customers:
+        await add_conversation_history(all_customers[0]['id'], example_message)
+        print("Added test conversation")
+    
+    await supabase_connector.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main_example())
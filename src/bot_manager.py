@@ -1,22 +1,40 @@
 import time
+import heapq
 import asyncio
+import logging
 import threading
 import os
-from typing import Dict, Optional
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, Final, Optional
+
+from fastchat import Fastchat
+
+try:
+    import diskcache
+except ImportError:  # Optional: only needed to persist the customer cache
+    diskcache = None
 
 import handle_messages
 import supabase_connector
 from chat_bot import initialize, chating
 
+logger = logging.getLogger(__name__)
+
+TIMING_DEBUG: Final = os.getenv("TIMING_DEBUG", "true").lower() == "true"
+# Operations whose timings are always logged
+_CRITICAL_OPERATIONS: Final = frozenset({"TOTAL_MESSAGE_PROCESSING", "AI_RESPONSE_GENERATION", "CUSTOMER_DATA_HANDLING"})
+
 class OptimizedTimer:
     """Lightweight timer with minimal overhead and environment control."""
     
     def __init__(self):
-        self.enabled = os.getenv("TIMING_DEBUG", "true").lower() == "true"
+        self.enabled = TIMING_DEBUG
         self.start_time = None
         self.operation_name = None
         self.phone = None
+        self.critical = False
     
     def start(self, operation_name: str, phone: Optional[str] = None):
         """Start timing an operation."""
@@ -25,68 +43,168 @@ class OptimizedTimer:
         
         self.operation_name = operation_name
         self.phone = phone
-        self.start_time = time.time()
+        self.start_time = time.monotonic()
         
         # Only log critical operations to reduce noise
-        if any(critical in operation_name for critical in ["TOTAL_MESSAGE", "AI_RESPONSE", "CUSTOMER_DATA"]):
-            phone_info = f" for {phone}" if phone else ""
-            print(f"⏱️ {operation_name}{phone_info}")
+        self.critical = operation_name in _CRITICAL_OPERATIONS
+        if self.critical:
+            logger.debug("⏱️ %s%s", operation_name, f" for {phone}" if phone else "")
     
     def end(self, details: Optional[str] = None):
         """End timing and log if slow or critical."""
         if not self.enabled or self.start_time is None:
             return 0
         
-        duration = time.time() - self.start_time
-        
-        # Only log if slow (>1s) or critical operations
-        should_log = (
-            duration > 1.0 or 
-            (self.operation_name and any(critical in self.operation_name for critical in ["TOTAL_MESSAGE", "AI_RESPONSE", "CUSTOMER_DATA"])) or
-            "ERROR" in (details or "")
-        )
+        duration = time.monotonic() - self.start_time
         
-        if should_log:
+        # Only log if slow (>1s), critical or failed
+        if duration > 1.0 or self.critical or (details and "ERROR" in details):
             phone_info = f" for {self.phone}" if self.phone else ""
             details_info = f" - {details}" if details else ""
             
             # Simplified color coding
-            emoji = "�" if duration > 2.0 else "🟡" if duration > 0.5 else "�"
-            print(f"{emoji} {self.operation_name}{phone_info} {duration:.2f}s{details_info}")
+            emoji = "🔴" if duration > 2.0 else "🟡" if duration > 0.5 else "🟢"
+            logger.info("%s %s%s %.2fs%s", emoji, self.operation_name, phone_info, duration, details_info)
         
         # Reset
         self.start_time = None
         self.operation_name = None
         self.phone = None
+        self.critical = False
         return duration
 
+# The pool is refilled up to the high watermark once it drops below the low one
+POOL_LOW_WATERMARK: Final = 3
+POOL_HIGH_WATERMARK: Final = 6
+# Bots created at startup; raise it for deployments that expect many
+# conversations right after startup
+INITIAL_POOL_SIZE: Final = int(os.getenv("INITIAL_POOL_SIZE", str(POOL_LOW_WATERMARK)))
+# Bot initializations allowed to run at the same time
+MAX_CONCURRENT_INITS: Final = 4
+# Longest aclose() waits for in-flight messages, and then for queued customer
+# data, before cancelling what is left
+SHUTDOWN_DRAIN_TIMEOUT: Final = 10  # seconds
+# Longest a message waits for a free bot before the user is asked to retry
+BOT_ASSIGNMENT_TIMEOUT: Final = 60  # seconds
+BOT_UNAVAILABLE_MESSAGE: Final = "⚠️ En este momento no puedo responder. Por favor, inténtalo de nuevo en unos minutos."
+# Delay before retrying failed bot initializations while users wait for a bot,
+# doubled after each consecutive failure up to the maximum
+BOT_INIT_RETRY_DELAY: Final = 1.0  # seconds
+BOT_INIT_RETRY_MAX_DELAY: Final = 30.0  # seconds
+# Retired bots kept warm for reuse instead of being closed
+IDLE_BOTS_MAX_SIZE: Final = 10
+IDLE_BOT_MAX_LIFETIME: Final = 60*60  # 1 hour in seconds
+# Assigned bots without interaction for this long are recycled
+INACTIVE_THRESHOLD: Final = 20*60  # 20 minutes in seconds
+# Inactive bots return to the pool until it holds this many free bots
+MAX_POOL_SIZE: Final = 10
+# Internal message that makes a bot drop the previous customer's context
+NEW_CONVERSATION_MESSAGE: Final = "SISTEMA: Se va a iniciar una nueva conversación. Olvida el contexto anterior y prepárate para atender a un nuevo cliente."
+# Most recently used customers kept in the phone -> customer_id cache
+CUSTOMER_CACHE_MAX_SIZE: Final = 10_000
+# Persisted phone -> customer_id entries (requires diskcache and CUSTOMER_CACHE_DIR)
+CUSTOMER_STORE_SIZE_LIMIT: Final = 50_000_000  # bytes
+CUSTOMER_STORE_TTL: Final = 7*24*60*60  # 1 week in seconds
+# Background workers that store customer data, and the jobs they may have queued
+CUSTOMER_DATA_WORKERS: Final = 4
+CUSTOMER_DATA_QUEUE_SIZE: Final = 1000
+# Chat commands, sent from the business account to a private chat
+PRIVATE_CHAT_DOMAIN: Final = "s.whatsapp.net"
+START_COMMAND: Final = "/start"
+BOT_REACTIVATED_MESSAGE: Final = "🤖 Bot reactivado. ¿En qué puedo ayudarte?"
+# Shared read-only default for payloads without a message
+_EMPTY: Final = MappingProxyType({})
+# Send the response in parts while it is generated instead of all at once
+STREAM_RESPONSES: Final = os.getenv("STREAM_RESPONSES", "false").lower() == "true"
+# Responses generated at the same time across all users
+MAX_CONCURRENT_LLM: Final = int(os.getenv("MAX_CONCURRENT_LLM", "8"))
+
+@dataclass(slots=True)
+class BotSlot:
+    """
+    Registry entry for a single bot instance.
+    
+    Attributes
+    ----------
+    bot : Fastchat
+        The Fastchat bot instance.
+    ts : float
+        Time of the last interaction with the bot, from ``time.monotonic()``.
+    active : bool
+        Whether the bot is currently responding to messages.
+    """
+    bot: Fastchat
+    ts: float = field(default_factory=time.monotonic)
+    active: bool = True
+
 class BotManager:
     """Manages bot instances, assignment, and lifecycle."""
     
-    def __init__(self, prompt: str):
+    def __init__(self, prompt: str, initial_pool_size: int = INITIAL_POOL_SIZE):
         """
         Initialize bot manager with system prompt.
         
-        Creates the initial pool of bots, starts the async event loop in a background
-        thread, and sets up the thread pool executor for async operations.
+        Starts the async event loop in a background thread, creates the initial
+        pool of bots on it, and starts the customer data workers.
         
         Parameters
         ----------
         prompt : str
             The system prompt to be used by all bot instances.
+        initial_pool_size : int, optional
+            The number of bots created up front. Defaults to
+            ``INITIAL_POOL_SIZE``, read from the environment variable of the
+            same name, or ``POOL_LOW_WATERMARK`` when it is not set.
         """
         self.prompt = prompt
-        self.bots_dict = self._initialize_bot_pool()
-        self._monitoring_active = False
-        # Create a thread pool executor for async operations
-        self.executor = ThreadPoolExecutor(max_workers=4)
-        # Customer cache optimization
-        self.customer_cache = {}  # phone -> customer_id mapping
-        self.cache_stats = {"hits": 0, "misses": 0}  # Cache performance statistics
-        # Create and start an event loop in a background thread
+        # Create and start an event loop in a background thread. It must be
+        # running before the pool is built so every bot is bound to it.
         self.loop = None
         self.loop_thread = None
         self._start_async_loop()
+        # Free bots waiting for a user, and bots assigned to users by phone.
+        # The pool is a queue so assignment can wait for a bot when it is empty.
+        self._pool = self._initialize_bot_pool(initial_pool_size)
+        # Bots being initialized for the pool, and a cap on concurrent initializations
+        self._pending_bots = 0
+        self._init_semaphore = asyncio.Semaphore(MAX_CONCURRENT_INITS)
+        # Background tasks started on the loop, referenced until they finish,
+        # and the pool refills among them
+        self._tasks: set[asyncio.Task] = set()
+        self._refills: set[asyncio.Task] = set()
+        # Set by aclose(); no new bots are created once it is set
+        self._closing = False
+        # Messages waiting on the empty pool, refill retries since the last
+        # successful initialization, and whether a retry is already scheduled
+        self._bot_waiters = 0
+        self._refill_retries = 0
+        self._refill_retry_scheduled = False
+        # Cap on responses being generated at once, so bursts queue instead of flooding the LLM
+        self._llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM)
+        self._assigned: Dict[str, BotSlot] = {}
+        # Reset bots retired by the monitor, as (bot_instance, idle_since) pairs
+        self._idle_bots = deque()
+        # Min-heap of (deadline, phone) inactivity checks for assigned bots,
+        # only touched on the background loop
+        self._deadlines = []
+        self._deadlines_changed = asyncio.Event()
+        # Per-user locks so one user's messages are answered one at a time
+        self._phone_locks: Dict[str, asyncio.Lock] = {}
+        self._monitoring_active = False
+        self._monitor_future = None
+        # Customer cache optimization
+        self.customer_cache: OrderedDict[str, str] = OrderedDict()  # phone -> customer_id, LRU order
+        self.cache_stats = {"hits": 0, "misses": 0}  # Cache performance statistics
+        # Optional on-disk copy of the cache, so it survives restarts
+        self._customer_store = self._open_customer_store()
+        # In-flight customer lookups by phone, shared by concurrent messages
+        self._customer_lookups: Dict[str, asyncio.Future] = {}
+        # Customer data jobs, handled by a fixed number of workers on the loop
+        self._customer_data_queue = asyncio.Queue(maxsize=CUSTOMER_DATA_QUEUE_SIZE)
+        self._workers = [
+            asyncio.run_coroutine_threadsafe(self._customer_data_worker(), self.loop)
+            for _ in range(CUSTOMER_DATA_WORKERS)
+        ]
     
     def _start_async_loop(self):
         """
@@ -101,38 +219,132 @@ class BotManager:
         The event loop runs indefinitely in the background thread until
         the application terminates.
         """
+        loop_ready = threading.Event()
+        
         def run_loop():
             self.loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self.loop)
+            # Signal readiness from inside the loop so is_running() is already true
+            self.loop.call_soon(loop_ready.set)
             self.loop.run_forever()
         
         self.loop_thread = threading.Thread(target=run_loop, daemon=True)
         self.loop_thread.start()
-        # Wait a bit for the loop to start
-        import time
-        time.sleep(0.1)
+        # Wait until the loop is actually running
+        if not loop_ready.wait(timeout=5.0):
+            raise RuntimeError("Background event loop failed to start")
+    
+    def _run_on_loop(self, coro):
+        """
+        Run a coroutine on the background event loop and wait for its result.
+        
+        Parameters
+        ----------
+        coro : coroutine
+            The coroutine to execute on ``self.loop``.
+            
+        Returns
+        -------
+        any
+            The value returned by the coroutine.
+            
+        Notes
+        -----
+        Must not be called from the loop thread itself, since it blocks
+        until the coroutine completes.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+    
+    def _spawn(self, coro, name: str) -> asyncio.Task:
+        """
+        Start a background task on ``self.loop`` and keep it referenced until it ends.
+        
+        Parameters
+        ----------
+        coro : coroutine
+            The coroutine to run.
+        name : str
+            The task name, used when logging its failure.
+            
+        Returns
+        -------
+        asyncio.Task
+            The started task.
+            
+        Notes
+        -----
+        Must be called on the loop thread. The loop only holds weak references
+        to tasks, so without ``self._tasks`` an unawaited task could be garbage
+        collected mid-flight; its exception, if any, is logged when it ends.
+        """
+        task = self.loop.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+        return task
     
-    def _initialize_bot_pool(self) -> Dict:
+    def _on_task_done(self, task: asyncio.Task):
+        """Forget a finished background task and log its exception, if any."""
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ Task %s failed: %s", task.get_name(), task.exception())
+    
+    def _on_loop_thread(self) -> bool:
+        """
+        Check whether the caller is running on the background event loop.
+        
+        Returns
+        -------
+        bool
+            True if ``self.loop`` is the event loop running in this thread.
+        """
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+    
+    def _initialize_bot_pool(self, size: int) -> asyncio.Queue:
         """
         Initialize the initial pool of available bots.
         
-        Creates three bot instances (A1, A2, A3) that are immediately available
-        for assignment to users. Each bot is initialized with the system prompt
-        and marked as active.
+        Creates ``size`` bot instances that are immediately available for
+        assignment to users. The bots are initialized concurrently with the
+        system prompt on the background event loop.
+        
+        Parameters
+        ----------
+        size : int
+            The number of bot instances to create.
         
         Returns
         -------
-        Dict
-            A dictionary mapping bot IDs to [timestamp, bot_instance, active_status].
-            The timestamp tracks the last interaction time, bot_instance is the
-            Fastchat object, and active_status is a boolean indicating if the bot
-            is currently responding to messages.
+        asyncio.Queue
+            The free Fastchat instances, in assignment order.
         """
-        return {
-            'A1': [time.time(), asyncio.run(initialize(self.prompt)), True],
-            'A2': [time.time(), asyncio.run(initialize(self.prompt)), True],
-            'A3': [time.time(), asyncio.run(initialize(self.prompt)), True]
-        }
+        pool = asyncio.Queue()
+        for bot_instance in self._run_on_loop(self._initialize_bots(size)):
+            pool.put_nowait(bot_instance)
+        return pool
+    
+    async def _initialize_bots(self, count: int) -> list:
+        """
+        Initialize several bot instances concurrently.
+        
+        Parameters
+        ----------
+        count : int
+            The number of bot instances to create.
+            
+        Returns
+        -------
+        list
+            The initialized Fastchat instances.
+            
+        Notes
+        -----
+        Bot initialization is I/O-bound, so running the calls together with
+        ``asyncio.gather`` costs roughly one initialization instead of ``count``.
+        """
+        return await asyncio.gather(*(initialize(self.prompt) for _ in range(count)))
     
     async def _send_new_conversation_signal(self, bot_instance):
         """
@@ -152,30 +364,92 @@ class BotManager:
         The message is processed internally by the bot and not stored in
         conversation history or returned as a response.
         """
-        new_conversation_message = "SISTEMA: Se va a iniciar una nueva conversación. Olvida el contexto anterior y prepárate para atender a un nuevo cliente."
         # Send the message but don't store it in conversation history
-        async for step in bot_instance(new_conversation_message):
+        async for step in bot_instance(NEW_CONVERSATION_MESSAGE):
             pass  # Just process the message internally, don't return response
     
     def start_monitoring(self):
         """
-        Start the bot monitoring thread.
+        Start the bot monitoring task.
         
-        Initiates a daemon thread that monitors inactive bots and manages their
-        lifecycle. The monitor checks every 30 seconds for bots that have been
-        inactive for more than 20 minutes and either closes them or converts
-        them back to the pool depending on the total number of assigned bots.
+        Schedules a task on the background event loop that monitors inactive
+        bots and manages their lifecycle. The monitor sleeps until the next bot
+        reaches 20 minutes of inactivity and either retires it or converts it
+        back to the pool depending on the total number of assigned bots.
         
         Notes
         -----
-        The monitoring thread is started only once. Subsequent calls to this
+        The monitoring task is started only once. Subsequent calls to this
         method will be ignored if monitoring is already active.
         """
         if not self._monitoring_active:
-            monitor_thread = threading.Thread(target=self._monitor_inactive_bots, daemon=True)
-            monitor_thread.start()
             self._monitoring_active = True
-            print("📊 Started bot inactivity monitor (checks every 30 seconds)")
+            self._monitor_future = asyncio.run_coroutine_threadsafe(
+                self._monitor_inactive_bots(),
+                self.loop
+            )
+            logger.info("📊 Started bot inactivity monitor (wakes on inactivity deadlines)")
+    
+    def stop_monitoring(self):
+        """
+        Stop the bot monitoring task.
+        
+        Wakes the monitor so it exits promptly instead of waiting for the next
+        inactivity deadline. Safe to call from any thread.
+        """
+        if self._monitoring_active:
+            self._monitoring_active = False
+            self.loop.call_soon_threadsafe(self._deadlines_changed.set)
+    
+    async def aclose(self):
+        """
+        Shut the manager down and close every bot instance: assigned, pooled and idle.
+        
+        Must run on ``self.loop``, which owns the bots, after the WebSocket has
+        stopped delivering messages.
+        
+        Notes
+        -----
+        Pending pool refills are cancelled and no new bots are created. Messages
+        already being answered get up to ``SHUTDOWN_DRAIN_TIMEOUT`` seconds to
+        finish, and the customer data they queued as long again to be handled;
+        whatever is left after that is cancelled. Errors from individual bots
+        are logged and do not stop the others from closing.
+        """
+        self._closing = True
+        for task in list(self._refills):
+            task.cancel()
+        
+        # Let in-flight messages finish so their turns reach the customer data queue
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("⚠️  Cancelled %s tasks still running at shutdown", len(pending))
+        
+        try:
+            await asyncio.wait_for(self._customer_data_queue.join(), SHUTDOWN_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️  Dropping %s queued customer data jobs at shutdown", self._customer_data_queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        
+        bots = [(phone, slot.bot) for phone, slot in self._assigned.items()]
+        self._assigned.clear()
+        while not self._pool.empty():
+            bots.append(("pool", self._pool.get_nowait()))
+        bots.extend(("idle", bot_instance) for bot_instance, _ in self._idle_bots)
+        self._idle_bots.clear()
+        bots = [(key, bot_instance) for key, bot_instance in bots if hasattr(bot_instance, 'close')]
+        logger.info("🤖 Closing %s bot instances...", len(bots))
+        results = await asyncio.gather(*(bot_instance.close() for _, bot_instance in bots), return_exceptions=True)
+        for (key, _), result in zip(bots, results):
+            if isinstance(result, BaseException):
+                logger.warning("⚠️  Error closing bot %s: %s", key, result)
+            else:
+                logger.debug("✅ Closed bot %s", key)
     
     def handle_message(self, connector, data: dict):
         """
@@ -199,32 +473,71 @@ class BotManager:
         Uses the background event loop for async operations to avoid blocking
         the WebSocket callback.
         """
+        key = data["data"]["key"]
+        # Parse the sender JID once: "<phone>@<domain>"
+        phone, _, domain = key["remoteJid"].partition('@')
+        
         # Only process messages not sent by ourselves
-        if not data["data"]["key"]["fromMe"]:
-            if data["data"]['key']['remoteJid'].split('@')[1] == "s.whatsapp.net":
-                phone = data["data"]['key']['remoteJid'].split('@')[0]
-                # Schedule async operation in background event loop
+        if not key["fromMe"]:
+            if domain == PRIVATE_CHAT_DOMAIN:
+                # Hand the message to the background event loop; nothing waits
+                # on the result, so skip run_coroutine_threadsafe's Future
                 if self.loop and self.loop.is_running():
-                    asyncio.run_coroutine_threadsafe(
-                        self._process_user_message(connector, phone, data), 
-                        self.loop
+                    self.loop.call_soon_threadsafe(
+                        self._start_user_message, connector, phone, data
                     )
                 else:
-                    print("❌ Event loop not available, processing message synchronously")
-                    # Fall back to sync processing - assign bot if needed
-                    if phone not in self.bots_dict:
-                        self._assign_bot_to_user(phone)
-                    
-                    if phone in self.bots_dict and self.bots_dict[phone][2]:
-                        self.bots_dict[phone][0] = time.time()
-                        print(f"📱 Responding to {phone}")
-                        # Note: This will still have the chating warning, but it's a fallback
-                        response = asyncio.run(handle_messages.get_chatbot_response(self.bots_dict[phone][1], data["data"]))
-                        #print(response)
-                        connector.send_message(phone, response)
-                        print("⚠️  Message processed but not saved to Supabase (async loop required)")
-        else:
-            self._process_bot_command(connector, data)
+                    # Bots belong to the background loop and cannot run on a new one
+                    logger.error("❌ Event loop not available, dropping message from %s", phone)
+        elif domain == PRIVATE_CHAT_DOMAIN:
+            # Commands read and change the assigned slots, which belong to the loop
+            if self.loop and self.loop.is_running():
+                self.loop.call_soon_threadsafe(
+                    self._start_bot_command, connector, phone, data
+                )
+            else:
+                logger.error("❌ Event loop not available, dropping command for %s", phone)
+    
+    def _start_bot_command(self, connector, phone: str, data: dict):
+        """
+        Start processing a command from the business account as a task on the background loop.
+        
+        Parameters
+        ----------
+        connector : EvolutionConnector
+            The Evolution API connector instance for sending messages.
+        phone : str
+            The phone number of the private chat the command was sent to.
+        data : dict
+            The message data received from the WebSocket.
+            
+        Notes
+        -----
+        Called through ``call_soon_threadsafe`` from the WebSocket thread, so
+        the slot is only read and changed on the loop and the reply is sent
+        without blocking the WebSocket callback.
+        """
+        self._spawn(self._process_bot_command(connector, phone, data), f"command for {phone}")
+    
+    def _start_user_message(self, connector, phone: str, data: dict):
+        """
+        Start processing a user message as a task on the background loop.
+        
+        Parameters
+        ----------
+        connector : EvolutionConnector
+            The Evolution API connector instance for sending messages.
+        phone : str
+            The user's phone number.
+        data : dict
+            The message data received from the WebSocket.
+            
+        Notes
+        -----
+        Called through ``call_soon_threadsafe`` from the WebSocket thread. Each
+        message gets its own task so different users are served concurrently.
+        """
+        self._spawn(self._process_user_message(connector, phone, data), f"message from {phone}")
     
     async def _process_user_message(self, connector, phone: str, data: dict):
         """
@@ -245,6 +558,10 @@ class BotManager:
             
         Notes
         -----
+        Response generation and sending hold a per-phone lock, so messages from
+        the same user are answered in order while different users are served
+        concurrently.
+        
         This function performs several async operations:
         - Bot response generation
         - Customer data management in Supabase
@@ -252,66 +569,82 @@ class BotManager:
         """
         timer = OptimizedTimer()
         timer.start("TOTAL_MESSAGE_PROCESSING", phone)
+        message_data = data["data"]
         
         # Assign bot if needed
-        if phone not in self.bots_dict:
+        slot = self._assigned.get(phone)
+        if slot is None:
             bot_timer = OptimizedTimer()
             bot_timer.start("BOT_ASSIGNMENT", phone)
-            self._assign_bot_to_user(phone)
+            try:
+                await self._assign_bot_to_user(phone)
+            except asyncio.TimeoutError:
+                bot_timer.end("ERROR: no bot available")
+                logger.error("❌ No bot became available for %s within %ss", phone, BOT_ASSIGNMENT_TIMEOUT)
+                await self._send_unavailable_message(connector, phone)
+                timer.end("ERROR: no bot available")
+                return
             bot_timer.end()
+            slot = self._assigned.get(phone)
         
         # Process message if bot is active
-        if phone in self.bots_dict and self.bots_dict[phone][2]:  # Bot is active
+        if slot is not None and slot.active:  # Bot is active
             # Update timestamp
-            self.bots_dict[phone][0] = time.time()
+            slot.ts = time.monotonic()
             
-            # Show typing indicator immediately
-            indicator_timer = OptimizedTimer()
-            indicator_timer.start("TYPING_INDICATOR", phone)
-            try:
-                connector.send_presence(phone, "composing", delay=5000)
-                indicator_timer.end("success")
-            except Exception as e:
-                indicator_timer.end(f"failed: {e}")
-                print(f"⚠️  Could not send typing indicator to {phone}: {e}")
-            
-            # Get response - THIS IS LIKELY THE BOTTLENECK
-            ai_timer = OptimizedTimer()
-            ai_timer.start("AI_RESPONSE_GENERATION", phone)
-            print(f"📱 Generating response for {phone}")
-            response = await handle_messages.get_chatbot_response(self.bots_dict[phone][1], data["data"])
-            ai_duration = ai_timer.end(f"response length: {len(response)} chars")
-            print(f"🤖 Generated response: {response[:100]}{'...' if len(response) > 100 else ''}")
-            
-            # Send response IMMEDIATELY
-            send_timer = OptimizedTimer()
-            send_timer.start("SEND_MESSAGE", phone)
-            print(f"📤 Sending response to {phone}")
-            connector.send_message(phone, response)
-            send_timer.end()
+            # Show typing indicator in the BACKGROUND so generation starts now
+            self._spawn(self._send_typing_indicator(connector, phone), f"typing indicator for {phone}")
+            
+            # Serialize messages from the same user: they share one bot and its history
+            async with self._phone_locks.setdefault(phone, asyncio.Lock()):
+                # Get response - THIS IS LIKELY THE BOTTLENECK
+                ai_timer = OptimizedTimer()
+                ai_timer.start("AI_RESPONSE_GENERATION", phone)
+                logger.debug("📱 Generating response for %s", phone)
+                async with self._llm_semaphore:
+                    if STREAM_RESPONSES:
+                        # Parts are sent to the user while the response is generated
+                        response = await handle_messages.stream_chatbot_response(
+                            slot.bot,
+                            message_data,
+                            lambda part: connector.send_message_async(phone, part)
+                        )
+                    else:
+                        response = await handle_messages.get_chatbot_response(slot.bot, message_data)
+                ai_duration = ai_timer.end(f"response length: {len(response)} chars")
+                logger.debug("🤖 Generated response: %s%s", response[:100], '...' if len(response) > 100 else '')
+                
+                if not STREAM_RESPONSES:
+                    # Send response IMMEDIATELY
+                    send_timer = OptimizedTimer()
+                    send_timer.start("SEND_MESSAGE", phone)
+                    logger.debug("📤 Sending response to %s", phone)
+                    await connector.send_message_async(phone, response)
+                    send_timer.end()
             
             # Handle customer and save messages in BACKGROUND (don't wait)
             db_timer = OptimizedTimer()
             db_timer.start("SCHEDULE_DB_OPERATIONS", phone)
-            print(f"💾 Scheduling DB operations for {phone}")
-            asyncio.create_task(self._handle_customer_data(connector, phone, data, response))
+            logger.debug("💾 Scheduling DB operations for %s", phone)
+            await self._customer_data_queue.put((connector, phone, data, response))
             db_timer.end()
             
             # Function ends HERE - User already received their response
             total_duration = timer.end()
-            print(f"✅ Message processing completed for {phone}")
+            logger.debug("✅ Message processing completed for %s", phone)
             
             # Summary log
-            print(f"📊 SUMMARY for {phone}: Total={total_duration:.3f}s, AI={ai_duration:.3f}s")
+            logger.info("📊 SUMMARY for %s: Total=%.3fs, AI=%.3fs", phone, total_duration, ai_duration)
         else:
             timer.end("bot not active or not found")
     
-    def _assign_bot_to_user(self, phone: str):
+    async def _assign_bot_to_user(self, phone: str):
         """
         Assign an available bot to a user.
         
-        Takes the first available bot from the pool (those with keys starting with 'A')
-        and assigns it to the specified phone number. After assignment, maintains
+        Takes the oldest free bot from the pool and assigns it to the specified
+        phone number, waiting for one to be created if the pool is empty.
+        After assignment, maintains
         the minimum pool size by creating new bots if necessary.
         
         Parameters
@@ -319,59 +652,181 @@ class BotManager:
         phone : str
             The user's phone number to assign a bot to.
             
+        Raises
+        ------
+        asyncio.TimeoutError
+            If no bot becomes free within ``BOT_ASSIGNMENT_TIMEOUT`` seconds.
+            
         Notes
         -----
         The bot is assigned directly without sending a new conversation signal.
         This allows the bot to maintain its system prompt while being ready to
         serve the new user.
         """
-        extra_keys = [k for k in self.bots_dict if k.startswith('A')]
-        if extra_keys:
-            first_extra = extra_keys[0]
-            assigned_bot = self.bots_dict.pop(first_extra)
-            
-            # Assign bot directly without sending new conversation signal
-            self.bots_dict[phone] = assigned_bot
-            print(f"🤖 Assigned bot {first_extra} to user {phone}")
-            
-            # Maintain pool size
+        if self._pool.empty():
+            # Start a refill before waiting on the empty pool
             self._maintain_bot_pool()
+        self._bot_waiters += 1
+        try:
+            bot_instance = await asyncio.wait_for(self._pool.get(), BOT_ASSIGNMENT_TIMEOUT)
+        finally:
+            self._bot_waiters -= 1
+        if phone in self._assigned:
+            # Another message from this user was assigned a bot while we waited
+            self._pool.put_nowait(bot_instance)
+            return
+        
+        # Assign bot directly without sending new conversation signal
+        assigned_bot = BotSlot(bot_instance)
+        self._assigned[phone] = assigned_bot
+        logger.info("🤖 Assigned pool bot to user %s (%s left in pool)", phone, self._pool.qsize())
+        self._schedule_inactivity_check(phone, assigned_bot.ts + INACTIVE_THRESHOLD)
+        
+        # Maintain pool size
+        self._maintain_bot_pool()
     
     def _maintain_bot_pool(self):
         """
-        Maintain minimum pool size of 3 available bots.
+        Maintain minimum pool size of ``POOL_LOW_WATERMARK`` available bots.
         
-        Ensures there are always at least 3 bots available in the pool for
-        immediate assignment to new users. Creates new bot instances asynchronously
+        When the free bots plus those already being initialized drop below the
+        low watermark, the pool is refilled in one batch up to
+        ``POOL_HIGH_WATERMARK``. Creates new bot instances asynchronously
         using the background event loop to avoid blocking the main thread.
         
         Notes
         -----
-        New bots are created with sequential IDs (A4, A5, etc.) and are initialized
-        with the same system prompt as the original pool bots. Bot creation is
+        New bots are initialized with the same system prompt as the original
+        pool bots. Bot creation is
         scheduled asynchronously and doesn't block the current operation.
+        ``_process_user_message`` runs on ``self.loop``, so calls made from it
+        use ``_spawn``; ``run_coroutine_threadsafe`` is only needed for
+        callers on other threads, such as the monitor. Idle
+        bots retired by the monitor are reused first, so a fresh instance is
+        only initialized when none is available.
         """
-        remaining_extra_keys = [k for k in self.bots_dict if k.startswith('A')]
-        if len(remaining_extra_keys) < 3:
-            next_index = max([int(k[1:]) for k in self.bots_dict if k.startswith('A')], default=0) + 1
-            new_key = f"A{next_index}"
-            
-            # Create bot asynchronously using background event loop
-            if self.loop and self.loop.is_running():
-                future = asyncio.run_coroutine_threadsafe(
-                    self._create_bot_async(new_key), 
-                    self.loop
-                )
-                # Don't wait for completion, just schedule it
-                print(f"🤖 Scheduling creation of new bot instance: {new_key}")
-            else:
-                # Fallback to sync creation
-                self.bots_dict[new_key] = [time.time(), asyncio.run(initialize(self.prompt)), True]
-                print(f"🤖 Created new bot instance: {new_key}")
+        if self._closing:
+            return
+        available = self._pool.qsize() + self._pending_bots
+        if available >= POOL_LOW_WATERMARK:
+            logger.debug("Pool has enough instances (%s), not creating new bot", available)
+            return
+        
+        # Reuse warm idle bots before paying for new initializations
+        while available < POOL_HIGH_WATERMARK:
+            idle_bot = self._take_idle_bot()
+            if idle_bot is None:
+                break
+            self._pool.put_nowait(idle_bot)
+            available += 1
+            logger.debug("♻️  Reused idle bot as pool bot (%s in pool)", self._pool.qsize())
+        
+        needed = POOL_HIGH_WATERMARK - available
+        if needed <= 0:
+            return
+        # Already on the loop (the usual case): schedule directly
+        if self._on_loop_thread():
+            self._pending_bots += needed
+            refill = self._spawn(self._prewarm_bots(needed), "pool refill")
+            self._refills.add(refill)
+            refill.add_done_callback(self._refills.discard)
+            logger.debug("🤖 Scheduling creation of %s new bot instances", needed)
+        # Create bots asynchronously using background event loop
+        elif self.loop and self.loop.is_running():
+            self._pending_bots += needed
+            asyncio.run_coroutine_threadsafe(
+                self._prewarm_bots(needed), 
+                self.loop
+            )
+            # Don't wait for completion, just schedule it
+            logger.debug("🤖 Scheduling creation of %s new bot instances", needed)
         else:
-            print(f"Pool has enough instances ({len(remaining_extra_keys)}), not creating new bot")
+            raise RuntimeError("BotManager loop not started")
     
-    async def _create_bot_async(self, new_key: str):
+    def _take_idle_bot(self) -> Optional[Fastchat]:
+        """
+        Take the most recently retired idle bot, if any.
+        
+        Returns
+        -------
+        Fastchat or None
+            A reset bot instance ready to rejoin the pool, or None if no idle
+            bot is available.
+        """
+        self._prune_idle_bots()
+        if self._idle_bots:
+            bot_instance, _ = self._idle_bots.pop()
+            return bot_instance
+        return None
+    
+    def _prune_idle_bots(self):
+        """
+        Close idle bots that have exceeded their maximum idle lifetime.
+        
+        Notes
+        -----
+        Idle bots are appended in retirement order, so expired ones are always
+        at the left end of the deque.
+        """
+        now = time.monotonic()
+        while self._idle_bots and now - self._idle_bots[0][1] > IDLE_BOT_MAX_LIFETIME:
+            bot_instance, _ = self._idle_bots.popleft()
+            if self._on_loop_thread():
+                self._spawn(bot_instance.close(), "idle bot close")
+            elif self.loop and self.loop.is_running():
+                asyncio.run_coroutine_threadsafe(bot_instance.close(), self.loop)
+            logger.debug("🗑️  Closed expired idle bot (%s idle left)", len(self._idle_bots))
+    
+    async def _retire_bot(self, key: str, bot_instance: Fastchat):
+        """
+        Park an inactive bot in the idle reserve, or close it if the reserve is full.
+        
+        Parameters
+        ----------
+        key : str
+            The phone number the bot was assigned to.
+        bot_instance : Fastchat
+            The bot instance to retire.
+            
+        Notes
+        -----
+        Parked bots receive the new conversation signal first so they can be
+        handed to a new customer without further preparation.
+        """
+        if len(self._idle_bots) < IDLE_BOTS_MAX_SIZE:
+            try:
+                await self._send_new_conversation_signal(bot_instance)
+                self._idle_bots.append((bot_instance, time.monotonic()))
+                logger.debug("💤 Parked bot %s as idle (%s idle)", key, len(self._idle_bots))
+                return
+            except Exception as e:
+                logger.error("❌ Error resetting bot %s, closing it instead: %s", key, e)
+        
+        try:
+            # Close the Fastchat bot instance (async method)
+            await bot_instance.close()
+            logger.debug("Successfully closed bot %s", key)
+        except Exception as e:
+            logger.warning("Error closing bot %s: %s", key, e)
+    
+    async def _prewarm_bots(self, count: int):
+        """
+        Create several bot instances concurrently.
+        
+        Parameters
+        ----------
+        count : int
+            The number of bot instances to create.
+            
+        Notes
+        -----
+        Each bot joins the pool as soon as it is ready, so users waiting on an
+        empty pool do not wait for the whole batch. ``_init_semaphore`` limits
+        how many initializations hit the LLM backend at once.
+        """
+        await asyncio.gather(*(self._create_bot_async() for _ in range(count)))
+    
+    async def _create_bot_async(self):
         """
         Create a new bot instance asynchronously.
         
@@ -379,23 +834,114 @@ class BotManager:
         it to the bot pool. This function runs in the background event loop to
         avoid blocking other operations.
         
+        Notes
+        -----
+        If bot creation fails, an error message is logged but the operation
+        continues. The bot pool may temporarily have fewer than
+        ``POOL_LOW_WATERMARK`` available bots until the next maintenance cycle.
+        While messages are waiting for a bot, the refill is retried with
+        exponential backoff instead.
+        """
+        try:
+            async with self._init_semaphore:
+                bot_instance = await initialize(self.prompt)
+            self._pool.put_nowait(bot_instance)
+            self._refill_retries = 0
+            logger.info("🤖 Created new bot instance (%s in pool)", self._pool.qsize())
+            return
+        except Exception as e:
+            logger.error("❌ Error creating bot: %s", e)
+        finally:
+            self._pending_bots -= 1
+        if self._bot_waiters and not self._refill_retry_scheduled:
+            delay = min(BOT_INIT_RETRY_MAX_DELAY, BOT_INIT_RETRY_DELAY * 2 ** min(self._refill_retries, 16))
+            self._refill_retries += 1
+            self._refill_retry_scheduled = True
+            self.loop.call_later(delay, self._retry_pool_refill)
+            logger.warning("⚠️  Retrying bot creation in %.1fs (%s waiting)", delay, self._bot_waiters)
+    
+    def _retry_pool_refill(self):
+        """Refill the pool again after failed initializations, if messages still wait for a bot."""
+        self._refill_retry_scheduled = False
+        if self._bot_waiters:
+            self._maintain_bot_pool()
+    
+    async def _send_unavailable_message(self, connector, phone: str):
+        """
+        Tell a user that no bot could answer their message.
+        
         Parameters
         ----------
-        new_key : str
-            The key identifier for the new bot (e.g., 'A4', 'A5').
+        connector : EvolutionConnector
+            The Evolution API connector instance for sending the message.
+        phone : str
+            The user's phone number.
+        """
+        try:
+            await connector.send_message_async(phone, BOT_UNAVAILABLE_MESSAGE)
+        except Exception as e:
+            logger.error("❌ Could not notify %s that no bot is available: %s", phone, e)
+    
+    async def _send_typing_indicator(self, connector, phone: str):
+        """
+        Show the "typing..." indicator to a user without blocking the caller.
+        
+        Parameters
+        ----------
+        connector : EvolutionConnector
+            The Evolution API connector instance for sending the presence.
+        phone : str
+            The user's phone number.
             
         Notes
         -----
-        If bot creation fails, an error message is logged but the operation
-        continues. The bot pool may temporarily have fewer than 3 available
-        bots until the next maintenance cycle.
+        Failures are only logged: the indicator is cosmetic and must never
+        keep the response from being generated.
         """
+        indicator_timer = OptimizedTimer()
+        indicator_timer.start("TYPING_INDICATOR", phone)
         try:
-            bot_instance = await initialize(self.prompt)
-            self.bots_dict[new_key] = [time.time(), bot_instance, True]
-            print(f"🤖 Created new bot instance: {new_key}")
+            await connector.send_presence_async(phone, "composing", 5000)
+            indicator_timer.end("success")
         except Exception as e:
-            print(f"❌ Error creating bot {new_key}: {e}")
+            indicator_timer.end(f"failed: {e}")
+            logger.warning("⚠️  Could not send typing indicator to %s: %s", phone, e)
+    
+    def _open_customer_store(self):
+        """
+        Open the on-disk customer cache, if one is configured.
+        
+        Returns
+        -------
+        diskcache.Cache or None
+            The persistent phone -> customer_id store, or None when
+            ``CUSTOMER_CACHE_DIR`` is not set or diskcache is not installed.
+        """
+        path = os.getenv("CUSTOMER_CACHE_DIR")
+        if not path:
+            return None
+        if diskcache is None:
+            logger.warning("⚠️  CUSTOMER_CACHE_DIR is set but diskcache is not installed; customer cache will not persist")
+            return None
+        return diskcache.Cache(path, size_limit=CUSTOMER_STORE_SIZE_LIMIT)
+    
+    async def _customer_data_worker(self):
+        """
+        Handle queued customer data jobs one at a time, forever.
+        
+        Notes
+        -----
+        ``CUSTOMER_DATA_WORKERS`` of these run on the background loop, which
+        caps concurrent Supabase work no matter how many messages arrive. When
+        the queue is full, ``_process_user_message`` waits for room after the
+        user already has the response.
+        """
+        while True:
+            job = await self._customer_data_queue.get()
+            try:
+                await self._handle_customer_data(*job)
+            finally:
+                self._customer_data_queue.task_done()
     
     async def _handle_customer_data(self, connector, phone: str, data: dict, response: str):
         """
@@ -403,6 +949,8 @@ class BotManager:
         
         Uses in-memory cache to avoid repeated database queries for known customers.
         This significantly reduces database load and improves response times.
+        The cache keeps the ``CUSTOMER_CACHE_MAX_SIZE`` most recently used
+        customers so memory stays bounded in long-running deployments.
         
         Parameters
         ----------
@@ -431,81 +979,126 @@ class BotManager:
             cache_timer.start("CACHE_CHECK", phone)
             if phone in self.customer_cache:
                 customer_id = self.customer_cache[phone]
+                self.customer_cache.move_to_end(phone)
                 self.cache_stats["hits"] += 1
                 cache_timer.end("HIT")
-                print(f"🚀 Cache HIT for {phone} -> customer_id: {customer_id}")
+                logger.debug("🚀 Cache HIT for %s -> customer_id: %s", phone, customer_id)
             else:
                 cache_timer.end("MISS")
                 # ✅ OPTIMIZATION 2: Only query DB if not in cache
                 self.cache_stats["misses"] += 1
-                print(f"🔍 Cache MISS for {phone}, querying database...")
+                logger.debug("🔍 Cache MISS for %s, querying database...", phone)
                 
-                # Check if customer exists in DB
-                db_check_timer = OptimizedTimer()
-                db_check_timer.start("DB_CHECK_CUSTOMER", phone)
-                existing_customers = await supabase_connector.get_customers(phone=phone)
-                db_check_timer.end(f"found {len(existing_customers)} customers")
-                
-                if len(existing_customers) == 0:
-                    # Create new customer
-                    username_timer = OptimizedTimer()
-                    username_timer.start("FETCH_USERNAME", phone)
-                    username = await connector.fetch_username_async(phone)
-                    username_timer.end(f"username: {username}")
-                    
-                    create_timer = OptimizedTimer()
-                    create_timer.start("CREATE_CUSTOMER", phone)
-                    result = await supabase_connector.add_customers(phone=phone, username=username)
-                    create_timer.end()
-                    
-                    if result and len(result) > 0:
-                        customer_id = result[0]['id']
-                        print(f"✅ Created new customer {customer_id} for {phone}")
+                # Concurrent messages from a new customer share one lookup, so
+                # the customer is queried (and created) only once
+                lookup = self._customer_lookups.get(phone)
+                if lookup is not None:
+                    customer_id = await lookup
                 else:
-                    customer_id = existing_customers[0]['id']
-                    print(f"📋 Found existing customer {customer_id} for {phone}")
+                    lookup = self.loop.create_future()
+                    self._customer_lookups[phone] = lookup
+                    try:
+                        customer_id = await self._fetch_customer_id(connector, phone)
+                        lookup.set_result(customer_id)
+                    finally:
+                        if not lookup.done():
+                            # Lookup failed: waiting messages skip saving instead of hanging
+                            lookup.set_result(None)
+                        del self._customer_lookups[phone]
                 
                 # ✅ OPTIMIZATION 3: Cache the result for future use
                 if customer_id:
                     cache_store_timer = OptimizedTimer()
                     cache_store_timer.start("CACHE_STORE", phone)
                     self.customer_cache[phone] = customer_id
+                    if len(self.customer_cache) > CUSTOMER_CACHE_MAX_SIZE:
+                        # Evict the least recently used customer
+                        self.customer_cache.popitem(last=False)
+                    if self._customer_store is not None:
+                        # diskcache does blocking SQLite and file I/O; keep it off the loop
+                        await asyncio.to_thread(self._customer_store.set, phone, customer_id, expire=CUSTOMER_STORE_TTL)
                     cache_store_timer.end()
-                    print(f"💾 Cached customer_id {customer_id} for {phone}")
+                    logger.debug("💾 Cached customer_id %s for %s", customer_id, phone)
             
             # Save messages to Supabase if we have a customer_id
             if customer_id:
-                # Save both messages concurrently for better performance
+                # Queue the user message and the response together, so both
+                # rows go to Supabase in the same bulk insert
                 save_timer = OptimizedTimer()
                 save_timer.start("SAVE_MESSAGES", phone)
-                await asyncio.gather(
-                    handle_messages.save_message(data["data"], customer_id=customer_id),
-                    handle_messages.save_message(
-                        {"message": response}, 
-                        is_bot=True, 
-                        customer_id=customer_id
-                    ),
-                    return_exceptions=True  # Don't fail if one message fails to save
+                await handle_messages.save_messages_bulk(
+                    [(data["data"], False), ({"message": response}, True)],
+                    customer_id=customer_id
                 )
-                save_timer.end("both messages saved")
-                print(f"💾 Messages saved to Supabase for customer {customer_id}")
+                save_timer.end("both messages queued")
+                logger.debug("💾 Messages queued for Supabase for customer %s", customer_id)
                 
                 # 📊 Show cache statistics every 10 operations
                 total_ops = self.cache_stats["hits"] + self.cache_stats["misses"]
                 if total_ops % 10 == 0:
                     hit_rate = (self.cache_stats["hits"] / total_ops) * 100
-                    print(f"📊 Cache stats: {hit_rate:.1f}% hit rate ({self.cache_stats['hits']} hits, {self.cache_stats['misses']} misses)")
+                    logger.debug("📊 Cache stats: %.1f%% hit rate (%s hits, %s misses)", hit_rate, self.cache_stats['hits'], self.cache_stats['misses'])
             else:
-                print(f"⚠️  Could not determine customer_id for {phone}, messages not saved")
+                logger.warning("⚠️  Could not determine customer_id for %s, messages not saved", phone)
             
             total_duration = timer.end()
-            print(f"📊 DB SUMMARY for {phone}: Total DB operations took {total_duration:.3f}s")
+            logger.info("📊 DB SUMMARY for %s: Total DB operations took %.3fs", phone, total_duration)
                 
         except Exception as e:
             timer.end(f"ERROR: {e}")
-            print(f"❌ Error handling customer data for {phone}: {e}")
+            logger.error("❌ Error handling customer data for %s: %s", phone, e)
+    
+    async def _fetch_customer_id(self, connector, phone: str) -> Optional[str]:
+        """
+        Look up a customer's ID in Supabase, creating the customer if needed.
+        
+        Parameters
+        ----------
+        connector : EvolutionConnector
+            The Evolution API connector for fetching user profile information.
+        phone : str
+            The user's phone number.
+            
+        Returns
+        -------
+        str or None
+            The customer ID, or None if the customer could not be created.
+        """
+        # A customer seen before the last restart is still in the disk store
+        if self._customer_store is not None:
+            customer_id = await asyncio.to_thread(self._customer_store.get, phone)
+            if customer_id is not None:
+                logger.debug("💽 Disk cache HIT for %s -> customer_id: %s", phone, customer_id)
+                return customer_id
+        
+        # Check if customer exists in DB (id column only)
+        db_check_timer = OptimizedTimer()
+        db_check_timer.start("DB_CHECK_CUSTOMER", phone)
+        customer_id = await supabase_connector.get_customer_id(phone)
+        db_check_timer.end("found" if customer_id else "not found")
+        
+        if customer_id is not None:
+            logger.debug("📋 Found existing customer %s for %s", customer_id, phone)
+            return customer_id
+        
+        # Create new customer
+        username_timer = OptimizedTimer()
+        username_timer.start("FETCH_USERNAME", phone)
+        username = await connector.fetch_username_async(phone)
+        username_timer.end(f"username: {username}")
+        
+        create_timer = OptimizedTimer()
+        create_timer.start("CREATE_CUSTOMER", phone)
+        result = await supabase_connector.add_customers(phone=phone, username=username)
+        create_timer.end()
+        
+        # Reuse the id of the inserted row instead of querying again
+        if result:
+            customer_id = result[0]['id']
+            logger.debug("✅ Created new customer %s for %s", customer_id, phone)
+        return customer_id
     
-    def _process_bot_command(self, connector, data: dict):
+    async def _process_bot_command(self, connector, phone: str, data: dict):
         """
         Process commands sent by the bot itself.
         
@@ -516,6 +1109,8 @@ class BotManager:
         ----------
         connector : EvolutionConnector
             The Evolution API connector for sending response messages.
+        phone : str
+            The phone number of the private chat the command was sent to.
         data : dict
             The message data containing the command.
             
@@ -525,123 +1120,168 @@ class BotManager:
         - '/start': Reactivates a bot for the user
         - Any other message: Deactivates the bot for the user
         """
-        if data["data"]['key']['remoteJid'].split('@')[1] == "s.whatsapp.net":
-            phone = data["data"]['key']['remoteJid'].split('@')[0]
+        slot = self._assigned.get(phone)
+        if slot is None:
+            return
+        if (data["data"].get("message") or _EMPTY).get("conversation") == START_COMMAND:
+            slot.active = True
+            await connector.send_message_async(phone, BOT_REACTIVATED_MESSAGE)
+        else:
+            slot.active = False
+    
+    def _schedule_inactivity_check(self, phone: str, deadline: float):
+        """
+        Schedule an inactivity check for an assigned bot.
+        
+        Parameters
+        ----------
+        phone : str
+            The phone number the bot is assigned to.
+        deadline : float
+            The time at which the bot becomes inactive if it sees no activity.
             
-            if data["data"].get("message", {}).get("conversation", "") == "/start":
-                if phone in self.bots_dict:
-                    self.bots_dict[phone][2] = True
-                    connector.send_message(phone, "🤖 Bot reactivado. ¿En qué puedo ayudarte?")
-            else:
-                if phone in self.bots_dict:
-                    self.bots_dict[phone][2] = False
+        Notes
+        -----
+        The heap is only modified on the background loop, so the monitor never
+        sees it change mid-pass; calls from other threads are handed over to it.
+        """
+        if not self._on_loop_thread():
+            self.loop.call_soon_threadsafe(self._schedule_inactivity_check, phone, deadline)
+            return
+        heapq.heappush(self._deadlines, (deadline, phone))
+        self._deadlines_changed.set()
     
-    def _monitor_inactive_bots(self):
+    async def _wait_for_due_bots(self) -> list:
         """
-        Monitor and manage inactive bots based on total count.
+        Wait until at least one inactivity deadline or idle bot expiry is due.
         
-        Runs continuously in a background thread, checking every 30 seconds for
-        bots that have been inactive for more than 20 minutes. Implements two
-        strategies based on the total number of assigned bots:
+        Returns
+        -------
+        list
+            Phone numbers whose inactivity deadline has passed. May be empty
+            when the wakeup was caused by an idle bot expiring or by
+            ``stop_monitoring``.
+        """
+        due = []
+        while self._monitoring_active:
+            now = time.monotonic()
+            while self._deadlines and self._deadlines[0][0] <= now:
+                due.append(heapq.heappop(self._deadlines)[1])
+            
+            wake_times = []
+            if self._deadlines:
+                wake_times.append(self._deadlines[0][0])
+            if self._idle_bots:
+                wake_times.append(self._idle_bots[0][1] + IDLE_BOT_MAX_LIFETIME)
+            
+            if due or (wake_times and min(wake_times) <= now):
+                break
+            self._deadlines_changed.clear()
+            try:
+                await asyncio.wait_for(
+                    self._deadlines_changed.wait(),
+                    timeout=min(wake_times) - now if wake_times else None
+                )
+            except asyncio.TimeoutError:
+                pass
+        return due
+    
+    async def _monitor_inactive_bots(self):
+        """
+        Monitor inactive bots and recycle them.
+        
+        Runs on the background event loop, sleeping until the earliest
+        inactivity deadline of an assigned bot (20 minutes after its last
+        interaction). Inactive bots are always reused rather than recreated:
         
-        - If more than 10 bots are assigned: closes inactive bots to free resources
-        - If 10 or fewer bots are assigned: converts inactive bots back to the pool
+        - If the pool has fewer than ``MAX_POOL_SIZE`` free bots: converts the
+          inactive bot back to the pool
+        - Otherwise: retires it to the idle reserve (closing it once the
+          reserve is full) to free resources
         
         Notes
         -----
-        This function runs indefinitely until the application terminates. Only
-        monitors bots assigned to users (not pool bots with keys starting with 'A').
+        This function runs until ``stop_monitoring`` is called. Only
+        bots assigned to users have deadlines; pool bots are never monitored.
+        
+        Deadlines live in a min-heap with one entry per assigned bot. When an
+        entry comes due but the bot has seen activity since, it is pushed back
+        with the new deadline instead of being expired (lazy invalidation).
         
         When converting bots back to the pool, sends a new conversation signal
         to reset their context before making them available for new users.
+        The signals for all bots due in one pass are sent concurrently.
         """
-        while True:
-            current_time = time.time()
-            inactive_threshold = 20*60  # 20 minutes in seconds
-            #inactive_threshold = 10  # Debug mode
-            
-            bots_to_remove = []  # List to store keys of bots to remove
-            bots_to_convert = []  # List to store bots to convert to pool
-            
-            # Count assigned bots (not pool bots)
-            assigned_bots = [key for key in self.bots_dict.keys() if not key.startswith('A')]
-            assigned_bot_count = len(assigned_bots)
-            
-            for key, bot_data in self.bots_dict.items():
-                # Only monitor bots assigned to users (skip pool bots starting with 'A')
-                if not key.startswith('A'):
-                    last_interaction_time = bot_data[0]
-                    bot_instance = bot_data[1]  # The Fastchat bot instance
-                    time_since_last_interaction = current_time - last_interaction_time
-                    
-                    # Check if bot has been inactive for more than 20 minutes
-                    if time_since_last_interaction > inactive_threshold:
-                        
-                        if assigned_bot_count > 10:
-                            # More than 10 bots: close the inactive ones
-                            print(f"Closing bot {key} - inactive for {time_since_last_interaction/60:.1f} minutes (total bots: {assigned_bot_count})")
-                            
-                            try:
-                                # Close the Fastchat bot instance (async method)
-                                asyncio.run(bot_instance.close())
-                                print(f"Successfully closed bot {key}")
-                            except Exception as e:
-                                print(f"Error closing bot {key}: {e}")
-                            
-                            # Mark for removal from dictionary
-                            bots_to_remove.append(key)
-                            
-                        else:
-                            # 10 or fewer bots: convert to pool bot
-                            print(f"Converting bot {key} to pool bot - inactive for {time_since_last_interaction/60:.1f} minutes (total bots: {assigned_bot_count})")
-                            bots_to_convert.append(key)
-            
-            # Remove closed bots from dictionary
-            for key in bots_to_remove:
-                if key in self.bots_dict:
-                    del self.bots_dict[key]
-                    print(f"Removed bot {key} from active dictionary")
-            
-            # Convert inactive bots to pool bots
-            for key in bots_to_convert:
-                if key in self.bots_dict:
-                    bot_data = self.bots_dict[key]
-                    bot_instance = bot_data[1]  # The Fastchat bot instance
-                    
-                    # Send new conversation signal before converting to pool bot
-                    try:
-                        asyncio.run(self._send_new_conversation_signal(bot_instance))
-                        print(f"🔄 Sent new conversation reset signal to bot {key} before converting to pool")
-                    except Exception as e:
-                        print(f"❌ Error sending new conversation signal to bot {key}: {e}")
-                    
-                    # Find next available A key
-                    existing_a_keys = [k for k in self.bots_dict.keys() if k.startswith('A')]
-                    if existing_a_keys:
-                        next_index = max([int(k[1:]) for k in existing_a_keys]) + 1
-                    else:
-                        next_index = 1
-                    new_key = f"A{next_index}"
-                    
-                    # Move bot to pool with new timestamp and active status
-                    self.bots_dict[new_key] = [time.time(), bot_instance, True]
-                    del self.bots_dict[key]
-                    print(f"♻️  Converted bot {key} to pool bot {new_key} (ready for new customers)")
+        while self._monitoring_active:
+            due = await self._wait_for_due_bots()
+            current_time = time.monotonic()
+            free_slots = MAX_POOL_SIZE - self._pool.qsize()
+            to_convert = []
+            to_retire = []
+            
+            for key in due:
+                bot_data = self._assigned.get(key)
+                if bot_data is None:
+                    continue
+                
+                deadline = bot_data.ts + INACTIVE_THRESHOLD
+                if deadline > current_time:
+                    # Bot was active since this deadline was set, check again later
+                    self._schedule_inactivity_check(key, deadline)
+                    continue
+                
+                time_since_last_interaction = current_time - bot_data.ts
+                bot_instance = bot_data.bot  # The Fastchat bot instance
+                
+                # Unassign first so a new message gets a fresh bot during the reset
+                del self._assigned[key]
+                self._phone_locks.pop(key, None)
+                
+                if free_slots <= 0:
+                    # Pool is full: retire the inactive bot
+                    logger.info("Retiring bot %s - inactive for %.1f minutes (pool full: %s)", key, time_since_last_interaction/60, self._pool.qsize())
+                    to_retire.append((key, bot_instance))
+                    continue
+                
+                # Room in the pool: convert to pool bot
+                logger.debug("Converting bot %s to pool bot - inactive for %.1f minutes", key, time_since_last_interaction/60)
+                to_convert.append((key, bot_instance))
+                free_slots -= 1
             
-            # Wait 30 seconds before next check
-            time.sleep(30)
+            # Send new conversation signals before converting to pool bots
+            results = await asyncio.gather(
+                *(self._send_new_conversation_signal(bot_instance) for _, bot_instance in to_convert),
+                *(self._retire_bot(key, bot_instance) for key, bot_instance in to_retire),
+                return_exceptions=True
+            )
+            for (key, bot_instance), result in zip(to_convert, results):
+                if isinstance(result, Exception):
+                    logger.error("❌ Error sending new conversation signal to bot %s: %s", key, result)
+                else:
+                    logger.debug("🔄 Sent new conversation reset signal to bot %s before converting to pool", key)
+                
+                # Move bot instance back to the pool
+                self._pool.put_nowait(bot_instance)
+                logger.info("♻️  Converted bot %s to pool bot (ready for new customers, %s in pool)", key, self._pool.qsize())
+            
+            self._prune_idle_bots()
     
-    def clear_customer_cache(self):
+    async def clear_customer_cache(self):
         """
         Clear customer cache and reset statistics.
         
+        The on-disk store, if configured, is cleared as well, in a worker
+        thread. Must run on ``self.loop``, which owns the in-memory cache.
+        
         Useful for debugging or when you want to force fresh database queries.
         Cache will be rebuilt automatically as customers interact with the bot.
         """
         cache_size = len(self.customer_cache)
         self.customer_cache.clear()
+        if self._customer_store is not None:
+            await asyncio.to_thread(self._customer_store.clear)
         self.cache_stats = {"hits": 0, "misses": 0}
-        print(f"🗑️  Customer cache cleared ({cache_size} entries removed)")
+        logger.info("🗑️  Customer cache cleared (%s entries removed)", cache_size)
     
     def get_cache_info(self):
         """
@@ -661,5 +1301,5 @@ class BotManager:
             "hit_rate_percentage": hit_rate,
             "cache_stats": self.cache_stats.copy(),
             "cached_phones": list(self.customer_cache.keys()),
-            "customer_mappings": self.customer_cache.copy()
+            "customer_mappings": dict(self.customer_cache)
         }
\ No newline at end of file
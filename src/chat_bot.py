@@ -1,5 +1,7 @@
 from fastchat import Fastchat  # Imports the Fastchat class for the chatbot
 import asyncio  # Imports asyncio for handling asynchronous functions
+import functools  # Imports functools for caching the system prompt
+from typing import AsyncIterator
 
 async def initialize(initial_prompt: str = "", model:str = "gpt-5-nano") -> Fastchat:
     """
@@ -17,11 +19,28 @@ async def initialize(initial_prompt: str = "", model:str = "gpt-5-nano") -> Fast
     """
     bot: Fastchat = Fastchat(extra_reponse_system_prompts=[initial_prompt], model=model)
     await bot.initialize()
-
-    #!Debuging
-    #print(bot)
     return bot
 
+async def stream_chating(bot: Fastchat, query: str) -> AsyncIterator[str]:
+    """
+    Sends a query to the bot and yields the response as it is generated.
+
+    Parameters
+    ----------
+    bot : Fastchat
+        The Fastchat instance to which the query will be sent.
+    query : str
+        The query to be sent to the chatbot.
+
+    Yields
+    ------
+    str
+        The response chunks, in the order the chatbot produces them.
+    """
+    async for step in bot(query):
+        if step.type == "response" and step.response is not None:
+            yield step.response  # Yields the response if available
+
 async def chating(bot: Fastchat, query: str) -> str:
     """
     Sends a query to the bot and returns the complete response.
@@ -38,16 +57,17 @@ async def chating(bot: Fastchat, query: str) -> str:
     str
         The complete response from the chatbot.
     """
-    response = ""
-    async for step in bot(query):
-        if step.type == "response" and step.response is not None:
-            response += step.response  # Adds the response if available
-    return response  # Returns the complete response
+    chunks = [chunk async for chunk in stream_chating(bot, query)]
+    return "".join(chunks)  # Returns the complete response
 
+@functools.lru_cache(maxsize=4)
 def get_system_prompt(file: str) -> str:
     """
     Reads and returns the content of a file as the system prompt.
 
+    The result is cached per path, so repeated calls do not touch the disk.
+    Pass the same absolute path every time to hit the cache.
+
     Parameters
     ----------
     file : str
@@ -58,9 +78,14 @@ def get_system_prompt(file: str) -> str:
     str
         The content of the file.
     """
-    with open(file, "r") as f:
+    with open(file, "r", encoding="utf-8") as f:
         return f.read()
 
+async def _demo() -> None:
+    """Runs the chatbot with the default prompt and a sample query."""
+    bot = await initialize()
+    print(await chating(bot, "Quiero una cita"))
+
 if __name__ == "__main__":
-    # Runs the chatbot with the default prompt and a sample query
-    asyncio.run(chating(asyncio.run(initialize()), "Quiero una cita"))
\ No newline at end of file
+    # Create and use the bot on the same event loop
+    asyncio.run(_demo())
\ No newline at end of file
@@ -1,21 +1,36 @@
 import os
+import math
 import time
-import asyncio
+import functools
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Optional
-from dotenv import load_dotenv
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from evolutionapi.client import EvolutionClient
-from evolutionapi.models.message import TextMessage
-from evolutionapi.models.chat import Presence
 from evolutionapi.models.profile import FetchProfile
+from evolutionapi.services.websocket import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+_TIMING_DEBUG = os.getenv("TIMING_DEBUG", "true").lower() == "true"
+
+# Operations whose timings are always logged
+_CRITICAL_OPERATIONS = frozenset({"FETCH_USERNAME_ASYNC", "SEND_MESSAGE_API"})
 
 class OptimizedTimer:
     """Lightweight timer with minimal overhead and environment control."""
     
     def __init__(self):
-        self.enabled = os.getenv("TIMING_DEBUG", "true").lower() == "true"
+        self.enabled = _TIMING_DEBUG
         self.start_time = None
         self.operation_name = None
         self.phone = None
+        self.critical = False
     
     def start(self, operation_name: str, phone: Optional[str] = None):
         """Start timing an operation."""
@@ -24,41 +39,166 @@ class OptimizedTimer:
         
         self.operation_name = operation_name
         self.phone = phone
-        self.start_time = time.time()
+        self.start_time = time.monotonic()
         
         # Only log critical operations to reduce noise
-        if self.operation_name and any(critical in operation_name for critical in ["FETCH_USERNAME", "SEND_MESSAGE_API"]):
-            phone_info = f" for {phone}" if phone else ""
-            print(f"⏱️ {operation_name}{phone_info}")
+        self.critical = operation_name in _CRITICAL_OPERATIONS
+        if self.critical:
+            logger.debug("⏱️ %s%s", operation_name, f" for {phone}" if phone else "")
     
     def end(self, details: Optional[str] = None):
         """End timing and log if slow or critical."""
         if not self.enabled or self.start_time is None:
             return 0
         
-        duration = time.time() - self.start_time
-        
-        # Only log if slow (>1s) or critical operations
-        should_log = (
-            duration > 1.0 or 
-            (self.operation_name and any(critical in self.operation_name for critical in ["FETCH_USERNAME", "SEND_MESSAGE_API"])) or
-            "ERROR" in (details or "")
-        )
+        duration = time.monotonic() - self.start_time
         
-        if should_log:
+        # Only log if slow (>1s), critical or failed
+        if duration > 1.0 or self.critical or (details and "ERROR" in details):
             phone_info = f" for {self.phone}" if self.phone else ""
             details_info = f" - {details}" if details else ""
             
             # Simplified color coding
-            emoji = "�" if duration > 2.0 else "🟡" if duration > 0.5 else "�"
-            print(f"{emoji} {self.operation_name}{phone_info} {duration:.2f}s{details_info}")
+            emoji = "🔴" if duration > 2.0 else "🟡" if duration > 0.5 else "🟢"
+            logger.info("%s %s%s %.2fs%s", emoji, self.operation_name, phone_info, duration, details_info)
         
         # Reset
         self.start_time = None
         self.operation_name = None
         self.phone = None
+        self.critical = False
         return duration
 
+# Profile names change rarely: cache them per phone, and remember misses briefly
+_USERNAME_TTL = 60*60  # 1 hour in seconds
+_USERNAME_NEGATIVE_TTL = 60  # seconds
+_USERNAME_CACHE_MAX_SIZE = 10_000
+
+# Connection limits for the shared async HTTP client
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=50, max_connections=200)
+_HTTP_TIMEOUT = 10.0  # seconds
+
+# Websocket reconnect delays: (first delay, maximum delay) in seconds
+_RECONNECT_BACKOFF = (0.2, 1.0)
+# Reconnect attempts per disconnect; 0 keeps retrying until stopped
+_RECONNECT_MAX_RETRIES = int(os.getenv("EVOLUTION_RECONNECT_MAX_RETRIES", "0"))
+
+@dataclass(frozen=True, slots=True)
+class _Config:
+    """Evolution API settings read from the environment."""
+    api_url: str
+    api_key: str
+    instance_id: str
+
+@functools.lru_cache(maxsize=1)
+def _load_config() -> _Config:
+    """
+    Loads and validates the Evolution API settings once per process.
+
+    Returns
+    -------
+    _Config
+        The validated settings.
+
+    Raises
+    ------
+    ValueError
+        If any of the required environment variables are not set.
+    """
+    api_url = os.environ.get("EVOLUTION_API_URL")
+    api_key = os.environ.get("EVOLUTION_API_KEY")
+    instance_id = os.environ.get("EVOLUTION_API_INSTANCE")
+
+    # Validate required environment variables
+    if not api_url:
+        raise ValueError("EVOLUTION_API_URL environment variable is not set.")
+    if not api_key:
+        raise ValueError("EVOLUTION_API_KEY environment variable is not set.")
+    if not instance_id:
+        raise ValueError("EVOLUTION_API_INSTANCE environment variable is not set.")
+
+    return _Config(api_url=api_url, api_key=api_key, instance_id=instance_id)
+
+class _KeepAliveEvolutionClient(EvolutionClient):
+    """
+    EvolutionClient that reuses pooled keep-alive connections.
+
+    The stock client calls ``requests.get``/``requests.post`` directly, which
+    opens a new TCP and TLS connection for every profile fetch, presence and
+    message. This subclass sends the same requests through one
+    ``requests.Session`` instead.
+    """
+
+    def __init__(self, base_url: str, api_token: str):
+        super().__init__(base_url=base_url, api_token=api_token)
+        self.session = requests.Session()
+        # Only connection failures are retried for POST, so a message is never sent twice
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=50,
+            max_retries=Retry(total=3, backoff_factor=0.2)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, endpoint: str, instance_token: str = None):
+        """Makes a GET request over the shared session."""
+        response = self.session.get(self._get_full_url(endpoint), headers=self._get_headers(instance_token))
+        return self._handle_response(response)
+
+    def post(self, endpoint: str, data: dict = None, instance_token: str = None, files: dict = None):
+        """Makes a JSON POST request over the shared session; uploads use the stock client."""
+        if files:
+            return super().post(endpoint, data=data, instance_token=instance_token, files=files)
+        response = self.session.post(self._get_full_url(endpoint), headers=self._get_headers(instance_token), json=data)
+        return response.json()
+
+    def delete(self, endpoint: str, instance_token: str = None):
+        """Makes a DELETE request over the shared session."""
+        response = self.session.delete(self._get_full_url(endpoint), headers=self._get_headers(instance_token))
+        return self._handle_response(response)
+
+class _BackoffWebSocketManager(WebSocketManager):
+    """
+    WebSocketManager with capped exponential reconnect backoff.
+
+    The stock manager starts at ``retry_delay`` and doubles it without
+    limit, and it retries a failed reconnect at the same delay without
+    counting it. This manager starts at ``backoff[0]`` seconds and doubles up
+    to ``backoff[1]``. It keeps retrying at that delay while
+    ``should_reconnect`` is set, unless ``max_retries`` is positive, in which
+    case it gives up after that many attempts.
+    """
+
+    def __init__(self, base_url: str, instance_id: str, api_token: str,
+                 max_retries: int = _RECONNECT_MAX_RETRIES,
+                 backoff: tuple[float, float] = _RECONNECT_BACKOFF):
+        super().__init__(
+            base_url=base_url,
+            instance_id=instance_id,
+            api_token=api_token,
+            max_retries=max_retries if max_retries > 0 else math.inf,
+            retry_delay=backoff[0]
+        )
+        self.max_retry_delay = backoff[1]
+
+    def _attempt_reconnect(self):
+        """Reconnect with exponential backoff capped at ``max_retry_delay``."""
+        while self.should_reconnect and self.retry_count < self.max_retries:
+            # The exponent is bounded so the delay stays a float once capped
+            delay = min(self.max_retry_delay, self.retry_delay * (2 ** min(self.retry_count, 16)))
+            self.logger.info(f"Attempting to reconnect in {delay:.2f} seconds...")
+            time.sleep(delay)
+            self.retry_count += 1
+            try:
+                self.connect()
+                self.retry_count = 0
+                return
+            except Exception as e:
+                self.logger.error(f"Error during reconnection attempt: {str(e)}")
+        if self.should_reconnect:
+            self.logger.error("All reconnection attempts failed")
+
 class EvolutionConnector:
     """
     Main connector class for Evolution API.
@@ -79,42 +219,57 @@ class EvolutionConnector:
     websocket : any
         The WebSocket manager for real-time events.
     """
-    def __init__(self):
+    def __init__(self, backoff: tuple[float, float] = _RECONNECT_BACKOFF):
         """
         Initializes the EvolutionConnector.
 
+        Parameters
+        ----------
+        backoff : tuple of float, optional
+            First and maximum delay in seconds between websocket reconnect
+            attempts. Defaults to (0.2, 1.0).
+
         Raises
         ------
         ValueError
             If any of the required environment variables are not set.
         """
-        load_dotenv()
-        self.api_url = os.getenv("EVOLUTION_API_URL")
-        self.api_key = os.getenv("EVOLUTION_API_KEY")
-        self.instance_id = os.getenv("EVOLUTION_API_INSTANCE")
-
-        # Validate required environment variables
-        if not self.api_url:
-            raise ValueError("EVOLUTION_API_URL environment variable is not set.")
-        if not self.api_key:
-            raise ValueError("EVOLUTION_API_KEY environment variable is not set.")
-        if not self.instance_id:
-            raise ValueError("EVOLUTION_API_INSTANCE environment variable is not set.")
-
-        # Initialize Evolution API client
-        self.client = EvolutionClient(
+        config = _load_config()
+        self.api_url = config.api_url
+        self.api_key = config.api_key
+        self.instance_id = config.instance_id
+
+        # Initialize Evolution API client (with keep-alive connections)
+        self.client = _KeepAliveEvolutionClient(
             base_url=self.api_url,
             api_token=self.api_key
         )
 
         # Create WebSocket manager for real-time events
-        self.websocket = self.client.create_websocket(
+        self.websocket = _BackoffWebSocketManager(
+            base_url=self.api_url,
             instance_id=self.instance_id,
             api_token=self.api_key,
-            max_retries=5,
-            retry_delay=1.0
+            max_retries=_RECONNECT_MAX_RETRIES,
+            backoff=backoff
         )
 
+        # Set by stop() to release the thread blocked in start_listening()
+        self._stop = threading.Event()
+
+        # phone -> (username, expires_at), in LRU order; fetches run in worker threads
+        self._username_cache: OrderedDict[str, tuple[str | None, float]] = OrderedDict()
+        self._username_lock = threading.Lock()
+
+        # Static parts of the send and profile requests, built once
+        base_url = self.api_url.rstrip('/')
+        self._send_text_url = f"{base_url}/message/sendText/{self.instance_id}"
+        self._send_presence_url = f"{base_url}/chat/sendPresence/{self.instance_id}"
+        self._fetch_profile_url = f"{base_url}/chat/fetchProfile/{self.instance_id}"
+        self._headers = {"apikey": self.api_key, "Content-Type": "application/json"}
+        # Keep-alive HTTP client, created on first use inside the event loop
+        self._http: Optional[httpx.AsyncClient] = None
+
     def start_listening(self, handle_message_fn):
         """
         Starts listening for incoming messages.
@@ -127,10 +282,44 @@ class EvolutionConnector:
         self.websocket.on("messages.upsert", handle_message_fn)
         self.websocket.connect()
 
-        print("Connected to WebSocket. Waiting for events...")
-        # Keep the process alive to listen for events
-        while True:
-            time.sleep(1)
+        logger.info("Connected to WebSocket. Waiting for events...")
+        # Keep the process alive to listen for events until stop() is called
+        self._stop.wait()
+
+    def stop(self):
+        """
+        Stops listening for incoming messages.
+
+        Disconnects the WebSocket and releases the thread blocked in
+        ``start_listening``.
+        """
+        self._stop.set()
+        if hasattr(self.websocket, 'disconnect'):
+            self.websocket.disconnect()
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Returns the shared keep-alive HTTP client, creating it on first use."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(headers=self._headers, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+        return self._http
+
+    def _get_cached_username(self, phone: str, now: float) -> tuple[bool, str | None]:
+        """Returns ``(hit, username)`` for a phone from the username cache."""
+        with self._username_lock:
+            cached = self._username_cache.get(phone)
+            if cached is not None and cached[1] > now:
+                self._username_cache.move_to_end(phone)
+                return True, cached[0]
+        return False, None
+
+    def _cache_username(self, phone: str, user_name: str | None, now: float):
+        """Stores a fetched username; misses are kept for a shorter time."""
+        ttl = _USERNAME_TTL if user_name else _USERNAME_NEGATIVE_TTL
+        with self._username_lock:
+            self._username_cache[phone] = (user_name, now + ttl)
+            self._username_cache.move_to_end(phone)
+            if len(self._username_cache) > _USERNAME_CACHE_MAX_SIZE:
+                self._username_cache.popitem(last=False)
     
     def fetch_username(self, phone: str) -> str | None:
         """
@@ -138,7 +327,8 @@ class EvolutionConnector:
         
         This method retrieves the WhatsApp profile information for the specified
         phone number using the Evolution API. It attempts to extract the display
-        name from the user's WhatsApp profile.
+        name from the user's WhatsApp profile. Results are cached for an hour,
+        and profiles without a name or failed lookups for a minute.
 
         Parameters
         ----------
@@ -157,33 +347,43 @@ class EvolutionConnector:
         # Validate required credentials
         if not self.instance_id or not self.api_key:
             return None
+
+        now = time.monotonic()
+        hit, user_name = self._get_cached_username(phone, now)
+        if hit:
+            return user_name
             
         # Create profile config with the actual sender's phone number
         config = FetchProfile(number=phone)
         
         # Fetch profile using correct parameters
-        profile_response = self.client.profile.fetch_profile(
-            instance_id=self.instance_id,
-            data=config,
-            instance_token=self.api_key
-        )
-        
-        # Extract user name if available
-        user_name = None
-        if profile_response and hasattr(profile_response, 'name'):
-            user_name = profile_response.name
-        elif isinstance(profile_response, dict) and 'name' in profile_response:
-            user_name = profile_response['name']
+        try:
+            profile_response = self.client.profile.fetch_profile(
+                instance_id=self.instance_id,
+                data=config,
+                instance_token=self.api_key
+            )
+        except Exception:
+            # Remember the failure briefly so an outage is not retried per message
+            self._cache_username(phone, None, now)
+            raise
         
+        # Extract user name if available (the SDK returns a dict; objects are tolerated)
+        if isinstance(profile_response, dict):
+            user_name = profile_response.get('name')
+        else:
+            user_name = getattr(profile_response, 'name', None)
+
+        self._cache_username(phone, user_name, now)
         return user_name
 
     async def fetch_username_async(self, phone: str) -> str | None:
         """
         Asynchronously fetches the username/profile name for a given phone number from WhatsApp.
         
-        This method retrieves the WhatsApp profile information for the specified
-        phone number using the Evolution API. It runs the synchronous API call
-        in a thread pool to avoid blocking the event loop.
+        Posts to the same fetchProfile endpoint as ``fetch_username`` over the
+        shared ``httpx.AsyncClient``, so the lookup never occupies a worker
+        thread. Shares the username cache with ``fetch_username``.
 
         Parameters
         ----------
@@ -197,28 +397,81 @@ class EvolutionConnector:
             
         Raises
         ------
-        Exception
-            Any exception that occurs during the API call to fetch the profile.
+        httpx.HTTPError
+            If the request fails or the API responds with an error status.
         """
+        if not self.instance_id or not self.api_key:
+            return None
+
+        now = time.monotonic()
+        hit, user_name = self._get_cached_username(phone, now)
+        if hit:
+            return user_name
+
         timer = OptimizedTimer()
         timer.start("FETCH_USERNAME_ASYNC", phone)
         
-        def _fetch_sync():
-            sync_timer = OptimizedTimer()
-            sync_timer.start("FETCH_USERNAME_SYNC", phone)
-            result = self.fetch_username(phone)
-            sync_timer.end(f"result: {result}")
-            return result
+        try:
+            response = await self._get_http().post(self._fetch_profile_url, json={"number": phone})
+            response.raise_for_status()
+            profile_response = response.json()
+            user_name = profile_response.get('name') if isinstance(profile_response, dict) else None
+            self._cache_username(phone, user_name, now)
+            timer.end(f"username: {user_name}")
+            return user_name
+        except Exception as e:
+            # Remember the failure briefly so an outage is not retried per message
+            self._cache_username(phone, None, now)
+            timer.end(f"ERROR: {e}")
+            raise
+
+    async def send_message_async(self, to: str, message: str) -> dict:
+        """
+        Sends a WhatsApp text message without blocking the event loop.
+
+        Posts to the same sendText endpoint as ``send_message``, but over a
+        persistent ``httpx.AsyncClient`` so the TCP and TLS handshakes are
+        reused across messages, with the URL and headers built only once.
+
+        Parameters
+        ----------
+        to : str
+            The recipient's phone number.
+        message : str
+            The message to be sent.
+
+        Returns
+        -------
+        dict
+            The JSON response from the API.
+
+        Raises
+        ------
+        httpx.HTTPStatusError
+            If the API responds with an error status.
+        """
+        timer = OptimizedTimer()
+        timer.start("SEND_MESSAGE_API", to)
         
         try:
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(None, _fetch_sync)
-            timer.end(f"username: {result}")
-            return result
+            response = await self._get_http().post(self._send_text_url, json={"number": to, "text": message})
+            response.raise_for_status()
+            timer.end(f"message length: {len(message)} chars")
+            return response.json()
         except Exception as e:
             timer.end(f"ERROR: {e}")
             raise
 
+    async def aclose(self):
+        """
+        Closes the HTTP client used by the async methods.
+
+        Must run on the event loop that sent the messages.
+        """
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
     def send_presence(self, to: str, presence_type: str = "composing", delay: int = 100000):
         """
         Sends a WhatsApp presence status (e.g., typing indicator).
@@ -239,12 +492,40 @@ class EvolutionConnector:
         """
         if not self.instance_id or not self.api_key:
             raise ValueError("instance_id and api_key must be set and not None.")
-        presence_config = Presence(
-            number=to,
-            delay=delay,  # milliseconds
-            presence=presence_type  # "composing" means typing
+        # Same body as the SDK's Presence model, without building it per call
+        self.client.session.post(
+            self._send_presence_url,
+            headers=self._headers,
+            json={"number": to, "delay": delay, "presence": presence_type}
+        )
+
+    async def send_presence_async(self, to: str, presence_type: str = "composing", delay: int = 100000):
+        """
+        Sends a WhatsApp presence status without blocking the event loop.
+
+        Parameters
+        ----------
+        to : str
+            The recipient's phone number.
+        presence_type : str, optional
+            The type of presence to send. Defaults to "composing".
+        delay : int, optional
+            The delay in milliseconds. Defaults to 100000.
+
+        Raises
+        ------
+        ValueError
+            If instance_id or api_key are not set.
+        httpx.HTTPStatusError
+            If the API responds with an error status.
+        """
+        if not self.instance_id or not self.api_key:
+            raise ValueError("instance_id and api_key must be set and not None.")
+        response = await self._get_http().post(
+            self._send_presence_url,
+            json={"number": to, "delay": delay, "presence": presence_type}
         )
-        self.client.chat.send_presence(self.instance_id, presence_config, self.api_key)
+        response.raise_for_status()
 
     def send_message(self, to: str, message: str):
         """
@@ -275,11 +556,12 @@ class EvolutionConnector:
                 timer.end("ERROR: missing credentials")
                 raise ValueError("instance_id and api_key must be set and not None.")
             
-            text_msg = TextMessage(
-                number=to,
-                text=message
-            )
-            result = self.client.messages.send_text(self.instance_id, text_msg, self.api_key)
+            # Same body as the SDK's send_text, posted to the prebuilt URL
+            result = self.client.session.post(
+                self._send_text_url,
+                headers=self._headers,
+                json={"number": to, "text": message}
+            ).json()
             timer.end(f"message length: {len(message)} chars")
             return result
         except Exception as e:
@@ -1,18 +1,29 @@
 import time
 import os
-from typing import Optional
+import queue
+import logging
+import atexit
+import threading
+from typing import Awaitable, Callable, Optional
 import supabase_connector
 import chat_bot
 from fastchat import Fastchat
 
+logger = logging.getLogger(__name__)
+
+_TIMING_DEBUG = os.getenv("TIMING_DEBUG", "true").lower() == "true"
+# Operations whose timings are always logged
+_CRITICAL_OPERATIONS = frozenset({"GET_CHATBOT_RESPONSE", "CHAT_BOT_PROCESSING"})
+
 class OptimizedTimer:
     """Lightweight timer with minimal overhead and environment control."""
     
     def __init__(self):
-        self.enabled = os.getenv("TIMING_DEBUG", "true").lower() == "true"
+        self.enabled = _TIMING_DEBUG
         self.start_time = None
         self.operation_name = None
         self.phone = None
+        self.critical = False
     
     def start(self, operation_name: str, phone: Optional[str] = None):
         """Start timing an operation."""
@@ -21,41 +32,45 @@ class OptimizedTimer:
         
         self.operation_name = operation_name
         self.phone = phone
-        self.start_time = time.time()
+        self.start_time = time.monotonic()
         
         # Only log critical operations to reduce noise
-        if any(critical in operation_name for critical in ["GET_CHATBOT_RESPONSE", "CHAT_BOT_PROCESSING"]):
-            phone_info = f" for {phone}" if phone else ""
-            print(f"⏱️ {operation_name}{phone_info}")
+        self.critical = operation_name in _CRITICAL_OPERATIONS
+        if self.critical:
+            logger.debug("⏱️ %s%s", operation_name, f" for {phone}" if phone else "")
     
     def end(self, details: Optional[str] = None):
         """End timing and log if slow or critical."""
         if not self.enabled or self.start_time is None:
             return 0
         
-        duration = time.time() - self.start_time
+        duration = time.monotonic() - self.start_time
         
-        # Only log if slow (>1s) or critical operations
-        should_log = (
-            duration > 1.0 or 
-            (self.operation_name and any(critical in self.operation_name for critical in ["GET_CHATBOT_RESPONSE", "CHAT_BOT_PROCESSING"])) or
-            "ERROR" in (details or "")
-        )
-        
-        if should_log:
+        # Only log if slow (>1s), critical or failed
+        if duration > 1.0 or self.critical or (details and "ERROR" in details):
             phone_info = f" for {self.phone}" if self.phone else ""
             details_info = f" - {details}" if details else ""
             
             # Simplified color coding
-            emoji = "�" if duration > 2.0 else "🟡" if duration > 0.5 else "�"
-            print(f"{emoji} {self.operation_name}{phone_info} {duration:.2f}s{details_info}")
+            emoji = "🔴" if duration > 2.0 else "🟡" if duration > 0.5 else "🟢"
+            logger.info("%s %s%s %.2fs%s", emoji, self.operation_name, phone_info, duration, details_info)
         
         # Reset
         self.start_time = None
         self.operation_name = None
         self.phone = None
+        self.critical = False
         return duration
 
+# Conversation history rows waiting to be written to Supabase in bulk
+_BATCH_SIZE = 100
+_FLUSH_INTERVAL = 1.0  # seconds
+_pending: queue.Queue = queue.Queue()
+_flush_requested = threading.Event()
+_flush_lock = threading.Lock()
+_flusher_thread: Optional[threading.Thread] = None
+_flusher_start_lock = threading.Lock()
+
 def format_message(data: dict, is_bot: bool = False) -> dict:
     """
     Formats the message data into the required structure for the 'message' (jsonb) field.
@@ -64,6 +79,8 @@ def format_message(data: dict, is_bot: bool = False) -> dict:
     ----------
     data : dict
         The input data containing the message information.
+    is_bot : bool
+        Whether this is a bot message or user message.
 
     Returns
     -------
@@ -74,17 +91,70 @@ def format_message(data: dict, is_bot: bool = False) -> dict:
     if is_bot:
         content = data["message"]  # Extracts the bot's message content
     else:
-        content = data.get("message", {}).get("conversation", ""),  # Extracts the message content
+        content = data.get("message", {}).get("conversation", "")  # Extracts the message content
     return {
-        "type": f"{'bot' if is_bot else 'human'}",  # Indicates the message type (currently set to 'human')
-        "content": f"{content}",
+        "type": "bot" if is_bot else "human",  # Indicates who sent the message
+        "content": content,
         "additional_kwargs": {},  # Placeholder for additional arguments
         "response_metadata": {}   # Placeholder for response metadata
     }
 
+def flush_pending() -> None:
+    """
+    Writes every queued message to Supabase, in batches of up to 100 rows.
+
+    Notes
+    -----
+    Runs on the background flusher thread and once more at interpreter exit.
+    The lock guarantees a batch already taken from the queue is written before
+    the exit flush drains what is left. The connector retries a batch only when
+    the request never reached Supabase; any other failure drops the batch,
+    since it may already be stored or can never succeed.
+    """
+    with _flush_lock:
+        while True:
+            rows = []
+            try:
+                while len(rows) < _BATCH_SIZE:
+                    rows.append(_pending.get_nowait())
+            except queue.Empty:
+                pass
+            if not rows:
+                return
+            
+            timer = OptimizedTimer()
+            timer.start("FLUSH_MESSAGES_TO_DB")
+            try:
+                supabase_connector.add_conversation_history_bulk(rows)
+                timer.end(f"{len(rows)} messages")
+            except Exception as e:
+                timer.end(f"ERROR: {e}")
+                logger.error("❌ Error saving %s messages to Supabase, dropping them: %s", len(rows), e)
+
+def _flusher() -> None:
+    """Flushes queued messages every second, or sooner when a batch fills up."""
+    while True:
+        _flush_requested.wait(timeout=_FLUSH_INTERVAL)
+        _flush_requested.clear()
+        flush_pending()
+
+def _ensure_flusher() -> None:
+    """Starts the background flusher thread on first use."""
+    global _flusher_thread
+    if _flusher_thread is not None:
+        return
+    with _flusher_start_lock:
+        if _flusher_thread is None:
+            _flusher_thread = threading.Thread(target=_flusher, daemon=True)
+            _flusher_thread.start()
+            atexit.register(flush_pending)
+
 async def save_message(data: dict, is_bot: bool = False, customer_id: str = "") -> None:
     """
-    Saves the formatted message to the conversation history in Supabase with timing.
+    Queues the formatted message for a batched insert into the conversation history.
+
+    The row is written to Supabase by a background flusher thread together with
+    other pending messages, so this returns without waiting on the network.
 
     Parameters
     ----------
@@ -94,17 +164,40 @@ async def save_message(data: dict, is_bot: bool = False, customer_id: str = "")
         Whether this is a bot message or user message.
     customer_id : str
         The customer ID to associate with the message.
+
+    Notes
+    -----
+    User payloads without text (media, receipts) are skipped, since they would
+    only store an empty row.
     """
-    timer = OptimizedTimer()
-    timer.start("SAVE_MESSAGE_TO_DB")
-    
-    try:
-        formatted_data = format_message(data, is_bot)
-        await supabase_connector.add_conversation_history(customer_id=customer_id, message=formatted_data)
-        timer.end(f"{'bot' if is_bot else 'user'} message for customer {customer_id}")
-    except Exception as e:
-        timer.end(f"ERROR: {e}")
-        raise
+    await save_messages_bulk([(data, is_bot)], customer_id=customer_id)
+
+async def save_messages_bulk(messages: list[tuple[dict, bool]], customer_id: str = "") -> None:
+    """
+    Queues several messages of one customer for the batched insert at once.
+
+    Used to store a whole conversation turn (user message and bot reply) with
+    a single call, so both rows always land in the same flush.
+
+    Parameters
+    ----------
+    messages : list of tuple of (dict, bool)
+        The ``(data, is_bot)`` pairs to save, in conversation order.
+    customer_id : str
+        The customer ID to associate with the messages.
+
+    Notes
+    -----
+    User payloads without text (media, receipts) are skipped, as in
+    ``save_message``.
+    """
+    _ensure_flusher()
+    for data, is_bot in messages:
+        if not is_bot and not data.get("message", {}).get("conversation", ""):
+            continue
+        _pending.put({"customer_id": customer_id, "message": format_message(data, is_bot)})
+    if _pending.qsize() >= _BATCH_SIZE:
+        _flush_requested.set()
 
 async def get_chatbot_response(bot: Fastchat, data: dict):
     """
@@ -127,7 +220,7 @@ async def get_chatbot_response(bot: Fastchat, data: dict):
     
     try:
         query = data.get("message", {}).get("conversation", "")
-        print(f"🤖 Querying chatbot with: '{query[:100]}{'...' if len(query) > 100 else ''}'")
+        logger.debug("🤖 Querying chatbot with: '%s%s'", query[:100], '...' if len(query) > 100 else '')
         
         # This is likely the main bottleneck - measure it separately
         chat_timer = OptimizedTimer()
@@ -139,10 +232,81 @@ async def get_chatbot_response(bot: Fastchat, data: dict):
         
         # Log slow responses
         if total_duration and total_duration > 5.0:
-            print(f"🐌 SLOW AI RESPONSE: {total_duration:.3f}s for query: '{query[:100]}'")
+            logger.warning("🐌 SLOW AI RESPONSE: %.3fs for query: '%s'", total_duration, query[:100])
         
         return response
     except Exception as e:
         timer.end(f"ERROR: {e}")
-        print(f"❌ Error getting chatbot response: {e}")
-        raise
\ No newline at end of file
+        logger.error("❌ Error getting chatbot response: %s", e)
+        raise
+
+def _last_sentence_end(text: str) -> int:
+    """Returns the index of the whitespace after the last sentence end in ``text``, or -1."""
+    end = max(text.rfind(". "), text.rfind("! "), text.rfind("? "))
+    if end >= 0:
+        end += 1  # the space after the punctuation
+    return max(end, text.rfind("\n"))
+
+async def stream_chatbot_response(bot: Fastchat, data: dict, send: Callable[[str], Awaitable],
+                                  min_chars: int = 80, max_delay: float = 0.3) -> str:
+    """
+    Streams the chatbot response to the user in coalesced parts.
+
+    Chunks are buffered and handed to ``send`` once at least ``min_chars``
+    characters are pending or ``max_delay`` seconds have passed since the last
+    send, so the user sees the reply early without one API call per token.
+    Buffers are cut after the last complete sentence when there is one, and
+    otherwise at the last whitespace, so words are never split.
+
+    Parameters
+    ----------
+    bot : Fastchat
+        The Fastchat instance to which the query will be sent.
+    data : dict
+        The input data containing the message information.
+    send : callable
+        Coroutine function called with each text part to deliver it to the user.
+    min_chars : int, optional
+        Buffered characters that trigger a send. Defaults to 80.
+    max_delay : float, optional
+        Seconds since the last send that trigger a send. Defaults to 0.3.
+
+    Returns
+    -------
+    str
+        The complete response from the chatbot.
+    """
+    timer = OptimizedTimer()
+    timer.start("GET_CHATBOT_RESPONSE")
+    
+    try:
+        query = data.get("message", {}).get("conversation", "")
+        logger.debug("🤖 Streaming chatbot response for: '%s%s'", query[:100], '...' if len(query) > 100 else '')
+        
+        chunks = []
+        buf = ""
+        last_flush = time.monotonic()
+        async for chunk in chat_bot.stream_chating(bot, query):
+            chunks.append(chunk)
+            buf += chunk
+            if len(buf) >= min_chars or time.monotonic() - last_flush > max_delay:
+                # Prefer sentence ends; fall back to the last whitespace so words stay whole
+                cut = _last_sentence_end(buf)
+                if cut <= 0:
+                    cut = max(buf.rfind(" "), buf.rfind("\n"))
+                if cut > 0:
+                    part, buf = buf[:cut].strip(), buf[cut + 1:]
+                    if part:
+                        await send(part)
+                    last_flush = time.monotonic()
+        
+        if buf.strip():
+            await send(buf.strip())
+        
+        response = "".join(chunks)
+        timer.end(f"response length: {len(response)} chars")
+        return response
+    except Exception as e:
+        timer.end(f"ERROR: {e}")
+        logger.error("❌ Error streaming chatbot response: %s", e)
+        raise
@@ -1,30 +1,81 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import os
+import queue
 import signal
 import sys
 import asyncio
-from typing import Optional
-from dotenv import load_dotenv
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    # Imported in main(): they pull in the Evolution, Supabase and LLM clients
+    from evolution_ws import EvolutionConnector
+    from bot_manager import BotManager
 
-from evolution_ws import EvolutionConnector
-from bot_manager import BotManager
-from chat_bot import get_system_prompt
+logger = logging.getLogger(__name__)
 
 # Global variables for cleanup
 connector: Optional[EvolutionConnector] = None
 bot_manager: Optional[BotManager] = None
+log_listener: Optional[QueueListener] = None
+
+# System prompt shipped with the repository, resolved once at import
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT_PATH = os.path.join(PROJECT_ROOT, "prompts", "initial_prompt.txt")
+DOTENV_PATH = os.path.join(PROJECT_ROOT, ".env")
+
+def load_environment() -> None:
+    """
+    Load the project's ``.env`` file into the environment, once, at startup.
+    
+    Skipped when the file does not exist (variables injected by the container
+    or the shell) or when ``LOAD_DOTENV`` is ``false``. Variables already set
+    in the environment take precedence over the file. Must run before the
+    other modules are imported, since some read their settings at import.
+    """
+    if os.getenv("LOAD_DOTENV", "true").lower() != "true" or not os.path.isfile(DOTENV_PATH):
+        return
+    from dotenv import load_dotenv
+    load_dotenv(DOTENV_PATH)
+
+def setup_logging() -> QueueListener:
+    """
+    Route log records through a queue to a background writer thread.
+    
+    Logging calls only enqueue the record, so message handling never blocks
+    on writing to stdout. The level comes from ``LOG_LEVEL`` (default INFO);
+    records below it are dropped before any formatting.
+    
+    Returns
+    -------
+    QueueListener
+        The started listener; stop it on shutdown to flush pending records.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    # Per-message logs are DEBUG; by default keep milestones and timings visible
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[QueueHandler(log_queue)])
+    listener.start()
+    return listener
 
 def signal_handler(signum, frame):
     """
     Handle shutdown signals (SIGINT, SIGTERM) for graceful cleanup.
     
     This function is called when the application receives a shutdown signal
-    (typically Ctrl+C). It performs cleanup operations including:
-    - Closing all bot instances
+    (typically Ctrl+C). It performs cleanup operations in this order:
+    - Disconnecting the WebSocket, so no new messages arrive
     - Stopping the bot manager monitoring
-    - Disconnecting WebSocket connections
-    - Shutting down async event loops
+    - Draining in-flight messages and customer data, then closing all bots
+    - Writing the queued conversation history to Supabase
+    - Closing the async HTTP sessions
+    - Stopping the log writer, last, so every record above is written
     
     Parameters
     ----------
@@ -33,45 +84,41 @@ def signal_handler(signum, frame):
     frame : frame object
         The current stack frame.
     """
-    print("\n🛑 Shutdown signal received. Cleaning up...")
+    logger.info("🛑 Shutdown signal received. Cleaning up...")
     
     try:
+        if connector:
+            logger.info("🌐 Disconnecting WebSocket...")
+            connector.stop()
+        
         if bot_manager:
-            print("📋 Closing bot manager...")
+            logger.info("📋 Closing bot manager...")
             # Stop monitoring
-            if hasattr(bot_manager, '_monitoring_active'):
-                bot_manager._monitoring_active = False
+            bot_manager.stop_monitoring()
             
-            # Close all bots
-            if hasattr(bot_manager, 'bots_dict'):
-                print(f"🤖 Closing {len(bot_manager.bots_dict)} bot instances...")
-                for key, bot_data in bot_manager.bots_dict.items():
-                    try:
-                        bot_instance = bot_data[1]
-                        if hasattr(bot_instance, 'close'):
-                            asyncio.run(bot_instance.close())
-                            print(f"✅ Closed bot {key}")
-                    except Exception as e:
-                        print(f"⚠️  Error closing bot {key}: {e}")
-            
-            # Shutdown executor
-            if hasattr(bot_manager, 'executor'):
-                print("🔧 Shutting down thread pool executor...")
-                bot_manager.executor.shutdown(wait=True)
+            # Drain the manager's work and close all bots on its loop
+            asyncio.run_coroutine_threadsafe(bot_manager.aclose(), bot_manager.loop).result(timeout=60)
         
-        if connector:
-            print("🌐 Disconnecting WebSocket...")
-            # If the websocket has a disconnect method, call it
-            if hasattr(connector, 'websocket') and hasattr(connector.websocket, 'disconnect'):
-                connector.websocket.disconnect()
+        # Write the history rows queued by the drained messages
+        import handle_messages
+        handle_messages.flush_pending()
         
-        print("✅ Cleanup completed successfully!")
+        if bot_manager:
+            # The HTTP clients belong to the bot manager's event loop
+            if connector:
+                asyncio.run_coroutine_threadsafe(connector.aclose(), bot_manager.loop).result(timeout=10)
+            import supabase_connector
+            asyncio.run_coroutine_threadsafe(supabase_connector.aclose(), bot_manager.loop).result(timeout=10)
+        
+        logger.info("✅ Cleanup completed successfully!")
         
     except Exception as e:
-        print(f"⚠️  Error during cleanup: {e}")
+        logger.error("⚠️  Error during cleanup: %s", e)
     
     finally:
-        print("👋 Evolution Connector shutting down...")
+        logger.info("👋 Evolution Connector shutting down...")
+        if log_listener:
+            log_listener.stop()
         sys.exit(0)
 
 def main():
@@ -105,21 +152,25 @@ def main():
     - SUPABASE_URL: Supabase project URL
     - SUPABASE_KEY: Supabase service key
     """
-    global connector, bot_manager
+    global connector, bot_manager, log_listener
+    
+    load_environment()
+    
+    from evolution_ws import EvolutionConnector
+    from bot_manager import BotManager
+    from chat_bot import get_system_prompt
     
     # Register signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)   # Ctrl+C
     signal.signal(signal.SIGTERM, signal_handler)  # Termination signal
-    
-    load_dotenv()
+
+    log_listener = setup_logging()
     
     # Initialize components
     connector = EvolutionConnector()
     
     # Get system prompt
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    prompt_path = os.path.join(os.path.dirname(script_dir), "prompts", "initial_prompt.txt")
-    prompt = get_system_prompt(prompt_path)
+    prompt = get_system_prompt(PROMPT_PATH)
     
     # Initialize bot manager
     bot_manager = BotManager(prompt)
@@ -128,8 +179,8 @@ def main():
     bot_manager.start_monitoring()
     
     # Start listening
-    print("🚀 Evolution Connector starting...")
-    print("💡 Press Ctrl+C to stop the application gracefully")
+    logger.info("🚀 Evolution Connector starting...")
+    logger.info("💡 Press Ctrl+C to stop the application gracefully")
     
     try:
         # Define message handler with proper type checking
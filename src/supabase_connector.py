@@ -1,29 +1,183 @@
 import os
+import time
+import random
 import asyncio
-from dotenv import load_dotenv
-from supabase import create_client
+import logging
+import threading
+import httpx
+from typing import AsyncIterator
+from postgrest.types import CountMethod
+from supabase import AsyncClient, Client, create_client
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-supabase = None  # Supabase client instance
+# Clients are created on first use, so importing this module needs no
+# credentials and opens no connections
+_supabase: Client | None = None
+_async_supabase: AsyncClient | None = None
+# PostgREST clients for the "chatbot" schema. schema() builds a new client,
+# with its own connection pool, on every call, so each is made once.
+_chatbot_schema = None
+_async_chatbot_schema = None
+# Request builders for chatbot.conversation_history. Each select()/insert()
+# returns a new query, so one builder serves every call.
+_history_table = None
+_async_history_table = None
+_clients_lock = threading.Lock()
 
-# Get Supabase credentials from environment variables
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
+def _get_credentials() -> tuple[str, str]:
+    """
+    Reads the Supabase credentials from the environment.
 
-# Initialize Supabase client if credentials are available
-supabase = None
-if SUPABASE_URL is not None and SUPABASE_ANON_KEY is not None:
-    supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-else:
-    # Raise error if credentials are missing
-    raise ValueError("Environment variables VITE_SUPABASE_URL and/or VITE_SUPABASE_ANON_KEY are not defined.")
+    Raises
+    -------
+    ValueError
+        If SUPABASE_URL or SUPABASE_ANON_KEY is not set.
+    """
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_ANON_KEY')
+    if url is None or key is None:
+        raise ValueError("Environment variables SUPABASE_URL and/or SUPABASE_ANON_KEY are not defined.")
+    return url, key
+
+def get_supabase() -> Client:
+    """
+    Returns the shared synchronous Supabase client, creating it on first use.
+
+    Raises
+    -------
+    ValueError
+        If the Supabase credentials are not set.
+    """
+    global _supabase
+    if _supabase is None:
+        with _clients_lock:
+            if _supabase is None:
+                _supabase = create_client(*_get_credentials())
+    return _supabase
+
+def get_async_supabase() -> AsyncClient:
+    """
+    Returns the shared asynchronous Supabase client, creating it on first use.
+
+    Its HTTP session binds to the event loop that first uses it.
+
+    Raises
+    -------
+    ValueError
+        If the Supabase credentials are not set.
+    """
+    global _async_supabase
+    if _async_supabase is None:
+        with _clients_lock:
+            if _async_supabase is None:
+                _async_supabase = AsyncClient(*_get_credentials())
+    return _async_supabase
+
+def _get_chatbot_schema():
+    """Returns the shared client for the "chatbot" schema, creating it on first use."""
+    global _chatbot_schema
+    if _chatbot_schema is None:
+        client = get_supabase()
+        with _clients_lock:
+            if _chatbot_schema is None:
+                _chatbot_schema = client.schema("chatbot")
+    return _chatbot_schema
+
+def _get_async_chatbot_schema():
+    """Returns the shared async client for the "chatbot" schema, creating it on first use."""
+    global _async_chatbot_schema
+    if _async_chatbot_schema is None:
+        client = get_async_supabase()
+        with _clients_lock:
+            if _async_chatbot_schema is None:
+                _async_chatbot_schema = client.schema("chatbot")
+    return _async_chatbot_schema
+
+def _get_history_table():
+    """Returns the shared request builder for chatbot.conversation_history."""
+    global _history_table
+    if _history_table is None:
+        _history_table = _get_chatbot_schema().table('conversation_history')
+    return _history_table
+
+def _get_async_history_table():
+    """Returns the shared async request builder for chatbot.conversation_history."""
+    global _async_history_table
+    if _async_history_table is None:
+        _async_history_table = _get_async_chatbot_schema().table('conversation_history')
+    return _async_history_table
+
+# Failures where the request never reached Supabase: safe to retry even for inserts
+_CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Reads are idempotent, so timeouts and dropped connections are retried too
+_READ_ERRORS = _CONNECT_ERRORS + (httpx.ReadTimeout, httpx.RemoteProtocolError)
+
+# Async requests in flight at once. Keeps bursts below Supabase's connection
+# limit, so extra requests wait here instead of failing there.
+_MAX_INFLIGHT = int(os.getenv("SUPABASE_MAX_INFLIGHT", "8"))
+_inflight = asyncio.Semaphore(_MAX_INFLIGHT)
+# Waits for a slot longer than this are logged
+_SLOW_WAIT = 0.1  # seconds
+
+async def _with_retries(make_request, retry_on: tuple, retries: int, base: float = 0.1, cap: float = 2.0):
+    """
+    Awaits ``make_request()``, retrying transient failures with jittered exponential backoff.
+
+    Each attempt holds one of the ``SUPABASE_MAX_INFLIGHT`` request slots; the
+    backoff between attempts does not.
+
+    Parameters
+    ----------
+    make_request : callable
+        Returns a new awaitable for the request on each call.
+    retry_on : tuple of type
+        The exception types that are retried.
+    retries : int
+        The maximum number of retries after the first attempt.
+    base : float, optional
+        The delay before the first retry, in seconds. Defaults to 0.1.
+    cap : float, optional
+        The maximum delay between attempts, in seconds. Defaults to 2.0.
+    """
+    for attempt in range(retries + 1):
+        try:
+            start = time.monotonic()
+            async with _inflight:
+                waited = time.monotonic() - start
+                if waited > _SLOW_WAIT:
+                    logger.debug("⏳ Waited %.3fs for a Supabase request slot", waited)
+                return await make_request()
+        except retry_on:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+def _with_retries_sync(make_request, retry_on: tuple, retries: int, base: float = 0.1, cap: float = 2.0):
+    """Blocking counterpart of ``_with_retries``, for the synchronous client."""
+    for attempt in range(retries + 1):
+        try:
+            return make_request()
+        except retry_on:
+            if attempt == retries:
+                raise
+            time.sleep(min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+# Last result of get_all_conversation_history, as (expires_at, rows)
+_HISTORY_CACHE_TTL = 60  # seconds
+_history_cache: tuple[float, list] | None = None
+
+def invalidate_history_cache():
+    """Drops the cached conversation history so the next read hits Supabase."""
+    global _history_cache
+    _history_cache = None
 
 def get_all_conversation_history():
     """
     Retrieves all conversation history records from Supabase.
 
+    The result is cached for a minute; writes through this module invalidate it.
+
     Returns
     -------
     list
@@ -31,15 +185,124 @@ def get_all_conversation_history():
 
     Raises
     -------
-    RuntimeError
-        If the Supabase client is not initialized.
+    ValueError
+        If the Supabase credentials are not set.
     """
-    if not supabase:
-        raise RuntimeError("Supabase client is not initialized.")
+    global _history_cache
+    cached = _history_cache
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
     # Query using the full schema and table name
-    response = supabase.schema("chatbot").table('conversation_history').select('*').execute()
+    response = _get_history_table().select('*').execute()
+    _history_cache = (time.monotonic() + _HISTORY_CACHE_TTL, response.data)
+    return response.data
+
+async def get_customer_history(customer_id: str, limit: int = 50, offset: int = 0,
+                               message_type: str | None = None):
+    """
+    Retrieves one page of a customer's conversation history, newest first.
+
+    Filtering, ordering and paging run in the database, so only the requested
+    rows are transferred, unlike ``get_all_conversation_history``.
+
+    Parameters
+    ----------
+    customer_id : str
+        The ID of the customer.
+    limit : int, optional
+        The maximum number of records to return. Defaults to 50.
+    offset : int, optional
+        The number of newest records to skip. Defaults to 0.
+    message_type : str, optional
+        Only return messages of this type ("human" or "bot"), filtered on the
+        jsonb ``message`` column in the database. Defaults to all types.
+
+    Returns
+    -------
+    list
+        The conversation history records of the customer.
+
+    Raises
+    -------
+    ValueError
+        If the Supabase credentials are not set.
+    """
+    def build_query():
+        query = _get_async_history_table().select('*').eq('customer_id', customer_id)
+        if message_type is not None:
+            query = query.eq('message->>type', message_type)
+        return query.order('created_at', desc=True).range(offset, offset + limit - 1)
+    
+    response = await _with_retries(lambda: build_query().execute(), _READ_ERRORS, retries=2)
     return response.data
 
+async def count_customer_history(customer_id: str | None = None) -> int:
+    """
+    Counts conversation history records without transferring them.
+
+    Parameters
+    ----------
+    customer_id : str, optional
+        Only count the records of this customer. Defaults to all records.
+
+    Returns
+    -------
+    int
+        The number of matching records.
+
+    Raises
+    -------
+    ValueError
+        If the Supabase credentials are not set.
+
+    Notes
+    -----
+    Uses an exact count on a HEAD request, so only the count header comes back.
+    The other getters never request counts, so PostgREST skips the extra
+    ``COUNT(*)`` for them.
+    """
+    def build_query():
+        query = _get_async_history_table().select('id', count=CountMethod.exact, head=True)
+        if customer_id is not None:
+            query = query.eq('customer_id', customer_id)
+        return query
+    
+    response = await _with_retries(lambda: build_query().execute(), _READ_ERRORS, retries=2)
+    return response.count or 0
+
+async def iter_customer_history(customer_id: str, batch: int = 1000) -> AsyncIterator[dict]:
+    """
+    Yields a customer's whole conversation history, newest first, one page at a time.
+
+    Only one page of ``batch`` records is held in memory, so long histories
+    can be processed without loading them into a single list.
+
+    Parameters
+    ----------
+    customer_id : str
+        The ID of the customer.
+    batch : int, optional
+        The number of records fetched per request. Defaults to 1000.
+
+    Yields
+    ------
+    dict
+        The conversation history records of the customer.
+
+    Raises
+    -------
+    ValueError
+        If the Supabase credentials are not set.
+    """
+    offset = 0
+    while True:
+        page = await get_customer_history(customer_id, limit=batch, offset=offset)
+        for record in page:
+            yield record
+        if len(page) < batch:
+            return
+        offset += batch
+
 async def get_customers(phone: str | None = None, customer_id: str | None = None):
     """
     Retrieves customer records from Supabase, optionally filtered by phone number or customer ID.
@@ -58,33 +321,56 @@ async def get_customers(phone: str | None = None, customer_id: str | None = None
 
     Raises
     -------
-    RuntimeError
-        If the Supabase client is not initialized.
     ValueError
-        If both phone and customer_id are provided (mutually exclusive).
+        If the Supabase credentials are not set, or if both phone and
+        customer_id are provided (mutually exclusive).
     """
-    if not supabase:
-        raise RuntimeError("Supabase client is not initialized.")
-    
     # Validate that only one filter is provided
     if phone is not None and customer_id is not None:
         raise ValueError("Cannot filter by both phone and customer_id. Use only one parameter.")
     
-    # Start building the query
-    query = supabase.table('customers').select('*')
-    
-    # Add phone filter if provided
-    if phone is not None:
-        query = query.eq('phone', phone)
-    
-    # Add customer_id filter if provided
-    if customer_id is not None:
-        query = query.eq('id', customer_id)
+    def build_query():
+        # Start building the query
+        query = get_async_supabase().table('customers').select('*')
+        
+        # Add phone filter if provided
+        if phone is not None:
+            query = query.eq('phone', phone)
+        
+        # Add customer_id filter if provided
+        if customer_id is not None:
+            query = query.eq('id', customer_id)
+        return query
     
     # Execute the query
-    response = query.execute()
+    response = await _with_retries(lambda: build_query().execute(), _READ_ERRORS, retries=2)
     return response.data
 
+async def get_customer_id(phone: str):
+    """
+    Retrieves only the ID of the customer with the given phone number.
+
+    Parameters
+    ----------
+    phone : str
+        The phone number of the customer.
+
+    Returns
+    -------
+    str or None
+        The customer ID, or None if no customer has that phone number.
+
+    Raises
+    -------
+    ValueError
+        If the Supabase credentials are not set.
+    """
+    response = await _with_retries(
+        lambda: get_async_supabase().table('customers').select('id').eq('phone', phone).limit(1).execute(),
+        _READ_ERRORS, retries=2
+    )
+    return response.data[0]['id'] if response.data else None
+
 async def add_customers(phone: str, username:str | None = None):
     """
     Adds a new customer record to Supabase.
@@ -101,16 +387,17 @@ async def add_customers(phone: str, username:str | None = None):
 
     Raises
     -------
-    RuntimeError
-        If the Supabase client is not initialized.
+    ValueError
+        If the Supabase credentials are not set.
     """
-    if not supabase:
-        raise RuntimeError("Supabase client is not initialized.")
     data = {
         "phone": phone,
         "user_name":username
     }
-    response = supabase.table('customers').insert(data).execute()
+    response = await _with_retries(
+        lambda: get_async_supabase().table('customers').insert(data).execute(),
+        _CONNECT_ERRORS, retries=3
+    )
     return response.data
 
 async def add_conversation_history(customer_id: str, message: dict):
@@ -131,48 +418,66 @@ async def add_conversation_history(customer_id: str, message: dict):
 
     Raises
     -------
-    RuntimeError
-        If the Supabase client is not initialized.
+    ValueError
+        If the Supabase credentials are not set.
     """
-    if not supabase:
-        raise RuntimeError("Supabase client is not initialized.")
     data = {
         "customer_id": customer_id,
         "message": message,
     }
-    response = supabase.schema("chatbot").table('conversation_history').insert(data).execute()
+    response = await _with_retries(
+        lambda: _get_async_history_table().insert(data).execute(),
+        _CONNECT_ERRORS, retries=3
+    )
+    invalidate_history_cache()
     return response.data
 
-async def main_example():
-    """Example usage of the async functions."""
-    # Retrieve all conversation history records
-    data = get_all_conversation_history()
-    print(f"Found {len(data)} conversation records")
-    
-    # Example: Get all customers
-    all_customers = await get_customers()
-    print(f"Found {len(all_customers)} customers")
-    
-    # Example: Get customer by phone
-    customer_by_phone = await get_customers(phone="34662578011")
-    print(f"Found {len(customer_by_phone)} customers with that phone")
-    
-    # Example: Get customer by ID
-    if all_customers:
-        customer_by_id = await get_customers(customer_id=all_customers[0]['id'])
-        print(f"Found {len(customer_by_id)} customers with that ID")
-    
-    example_message = {
-        "type": "human",
-        "content": "Test message",
-        "additional_kwargs": {},
-        "response_metadata": {}
-    }
-    
-    # Add a new conversation history record if we have customers
-    if all_customers:
-        await add_conversation_history(all_customers[0]['id'], example_message)
-        print("Added test conversation")
+def add_conversation_history_bulk(rows: list[dict]):
+    """
+    Adds several conversation history records to Supabase in a single request.
+
+    Like the other inserts, it is retried only when the request never reached
+    Supabase, so a batch is never written twice.
+
+    Parameters
+    ----------
+    rows : list of dict
+        The records to insert, each with ``customer_id`` and ``message`` keys.
+
+    Returns
+    -------
+    list
+        The data returned by the Supabase client.
+
+    Raises
+    -------
+    ValueError
+        If the Supabase credentials are not set.
+    """
+    if not rows:
+        return []
+    response = _with_retries_sync(lambda: _get_history_table().insert(rows).execute(), _CONNECT_ERRORS, retries=3)
+    invalidate_history_cache()
+    return response.data
+
+async def aclose():
+    """
+    Closes the HTTP sessions of the async Supabase clients.
 
-if __name__ == "__main__":
-    asyncio.run(main_example())
\ No newline at end of file
+    Must run on the event loop that used them, after the last async query.
+    The clients are forgotten first, so a later call creates fresh ones
+    instead of reusing closed sessions.
+    """
+    global _async_supabase, _async_chatbot_schema, _async_history_table
+    with _clients_lock:
+        client, schema = _async_supabase, _async_chatbot_schema
+        _async_supabase = _async_chatbot_schema = _async_history_table = None
+    if schema is not None:
+        await schema.aclose()
+    if client is not None:
+        # PostgREST and storage clients are created on first use; auth always exists
+        if client._postgrest is not None:
+            await client._postgrest.aclose()
+        if client._storage is not None:
+            await client._storage.aclose()
+        await client.auth.close()